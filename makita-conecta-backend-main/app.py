@@ -1,38 +1,71 @@
 from flask import Flask
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
-from database import init_db, close_db
-from routes.auth import auth_bp, bcrypt
+import database
+import cache
+import passwords
+import identity
+from commands import register_commands
+from routes.auth import auth_bp
 from routes.animals import animals_bp
+import tracing
+import metrics
+import ratelimit
+import health
+import storage
+import changes
 
-app = Flask(__name__)
-app.config.from_object(Config)
 
-CORS(app)
-bcrypt.init_app(app)
-jwt = JWTManager(app)
+def create_app(config=Config):
+    """Cria a aplicação sem tocar no banco além de uma leitura da versão do schema"""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if app.config["TRUSTED_PROXIES"]:
+        proxies = app.config["TRUSTED_PROXIES"]
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
 
-print("\n" + "="*50)
-print("Iniciando aplicação Flask...")
-print("="*50)
+    CORS(app, expose_headers=["Server-Timing", "X-Row-Count", "X-Cache"])
+    tracing.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)
+    passwords.init_app(app)
+    identity.init_app(app)
+    database.init_app(app)
+    health.init_app(app)
+    cache.init_app(app)
+    storage.init_app(app)
+    changes.init_app(app)
 
-init_db()
+    app.register_blueprint(auth_bp, url_prefix="/api")
+    app.register_blueprint(animals_bp, url_prefix="/api")
+    register_commands(app)
 
-try:
-    from seed_animal import run_seed
-    run_seed()
-except Exception as e:
-    print(f"⚠️ Erro no seed: {e}")
+    with app.app_context():
+        check_schema(app)
 
-app.register_blueprint(auth_bp, url_prefix="/api")
-app.register_blueprint(animals_bp, url_prefix="/api")
+    return app
+
+
+def check_schema(app):
+    """Avisa (ou migra, se DB_AUTO_MIGRATE) quando o banco está atrás do código"""
+    current_version, latest_version = database.schema_status()
+    if current_version >= latest_version:
+        return
+
+    if app.config["DB_AUTO_MIGRATE"]:
+        database.init_db()
+    else:
+        tracing.get_logger().error(
+            "Schema do banco desatualizado; execute 'flask db upgrade'",
+            extra={"current": current_version, "latest": latest_version},
+        )
 
-app.teardown_appcontext(close_db)
 
 if __name__ == "__main__":
+    app = create_app()
     print("\n" + "="*50)
     print("Aplicação iniciada com sucesso!")
     print(f"Servidor rodando em: http://127.0.0.1:5000")
     print("="*50 + "\n")
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=True, port=5000)
@@ -0,0 +1,203 @@
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timezone
+import migrations
+from database import connect
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+
+class BackupError(Exception):
+    """Cópia ilegível, corrompida ou de um schema mais novo que o código"""
+
+
+def backup_name(db_name, compress, now=None):
+    """database-20240131-235959.db.gz, com a hora em UTC para ordenar pelo nome"""
+    stem = os.path.splitext(os.path.basename(db_name))[0]
+    stamp = (now or datetime.now(timezone.utc)).strftime("%Y%m%d-%H%M%S")
+    return f"{stem}-{stamp}.db" + (".gz" if compress else "")
+
+
+def list_backups(directory, db_name):
+    """Cópias de `db_name` em `directory`, da mais nova para a mais antiga"""
+    stem = os.path.splitext(os.path.basename(db_name))[0]
+    pattern = re.compile(rf"^{re.escape(stem)}-\d{{8}}-\d{{6}}\.db(\.gz)?$")
+    try:
+        names = [name for name in os.listdir(directory) if pattern.match(name)]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names, reverse=True)]
+
+
+def copy_online(settings, target, pages, pause, progress=None):
+    """Copia o banco para `target` com a API de backup, `pages` páginas por passo.
+
+    Uma transação de leitura fica aberta na origem durante toda a cópia: com WAL os
+    escritores seguem normalmente, e a cópia inteira corresponde a esse instante. Sem
+    ela, cada escrita de outra conexão faria o SQLite recomeçar a cópia do início.
+    Entre os passos a cópia dorme `pause` segundos, para não disputar o disco.
+    """
+    source = connect(settings)
+    source.isolation_level = None
+    dest = sqlite3.connect(target)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining and pause:
+                time.sleep(pause)
+
+        source.backup(dest, pages=pages, progress=step)
+        source.execute("COMMIT")
+    finally:
+        source.close()
+        dest.close()
+
+
+def copy_compacted(settings, target):
+    """Copia com VACUUM INTO: sem páginas livres e com índices reorganizados.
+
+    Também lê de um único instante sem bloquear escritores, mas em um passo só.
+    """
+    source = connect(settings)
+    try:
+        source.execute("VACUUM INTO ?", (target,))
+    finally:
+        source.close()
+
+
+def verify(path):
+    """Confere a integridade de uma cópia e devolve a versão do schema dela"""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if result != "ok":
+            raise BackupError(f"cópia corrompida: {result}")
+        version = migrations.current_version(conn)
+        # Arquivo único, sem -wal ao lado, para poder ser movido e compactado
+        conn.execute("PRAGMA journal_mode = DELETE")
+    except sqlite3.DatabaseError as e:
+        raise BackupError(f"cópia ilegível: {e}") from e
+    finally:
+        conn.close()
+    return version
+
+
+def create_backup(settings, directory, compress=True, compact=False, pages=256, pause=0.01, keep=0, progress=None):
+    """Grava uma cópia consistente do banco em `directory` e remove as antigas além de `keep`.
+
+    O arquivo só aparece com o nome final depois de verificado (e compactado), então uma
+    cópia interrompida nunca é confundida com uma boa. Retorna o caminho da cópia.
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+    target = os.path.join(directory, backup_name(settings["DB_NAME"], compress))
+    fd, raw = tempfile.mkstemp(dir=directory, prefix=".backup-", suffix=".db")
+    os.close(fd)
+    try:
+        if compact:
+            # VACUUM INTO exige que o destino não exista
+            os.unlink(raw)
+            copy_compacted(settings, raw)
+        else:
+            copy_online(settings, raw, pages, pause, progress)
+        version = verify(raw)
+
+        if compress:
+            partial = raw + ".gz"
+            try:
+                with open(raw, "rb") as src, gzip.open(partial, "wb", compresslevel=6) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+                os.replace(partial, target)
+            except BaseException:
+                _unlink(partial)
+                raise
+        else:
+            os.replace(raw, target)
+    finally:
+        _unlink(raw)
+
+    logger.info("backup concluído", extra={
+        "path": target,
+        "bytes": os.path.getsize(target),
+        "schema": version,
+        "compact": compact,
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+    if keep:
+        rotate(directory, settings["DB_NAME"], keep)
+    return target
+
+
+def rotate(directory, db_name, keep):
+    """Apaga as cópias mais antigas, mantendo as `keep` mais novas; retorna as apagadas"""
+    removed = list_backups(directory, db_name)[keep:]
+    for path in removed:
+        _unlink(path)
+    return removed
+
+
+def restore_backup(settings, path):
+    """Substitui o conteúdo do banco pelo de uma cópia, com o banco em uso.
+
+    A cópia é descompactada e verificada antes de qualquer escrita. A substituição usa a
+    API de backup em um passo: as outras conexões veem o banco antigo ou o restaurado,
+    nunca um meio-termo, e os escritores esperam (busy_timeout) só durante a cópia.
+    Retorna a versão do schema restaurado.
+    """
+    directory = os.path.dirname(os.path.abspath(settings["DB_NAME"]))
+    fd, raw = tempfile.mkstemp(dir=directory, prefix=".restore-", suffix=".db")
+    os.close(fd)
+    try:
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, "rb") as src, open(raw, "wb") as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except (OSError, EOFError) as e:
+            raise BackupError(f"não foi possível ler {path}: {e}") from e
+        version = verify(raw)
+        if version > migrations.latest_version():
+            raise BackupError(f"cópia no schema {version}, mais novo que o deste código ({migrations.latest_version()})")
+
+        source = sqlite3.connect(raw)
+        live = connect(settings)
+        try:
+            generation = _max_generation(live)
+            source.backup(live)
+            # As gerações voltariam a valores já usados e o cache devolveria respostas de
+            # antes da restauração
+            if _max_generation(live) is not None:
+                with live:
+                    live.execute("UPDATE cache_generations SET value = value + ?", ((generation or 0) + 1,))
+        finally:
+            source.close()
+            live.close()
+    finally:
+        _unlink(raw)
+
+    logger.info("backup restaurado", extra={"path": path, "schema": version})
+    return version
+
+
+def _max_generation(conn):
+    """Maior geração do cache, ou None em schemas anteriores à tabela"""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(value), 0) FROM cache_generations").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,413 @@
+"""Load test da API com clientes concorrentes.
+
+    python -m benchmarks.loadtest --db bench.db --clients 16 --duration 30 --output resultado.json
+
+Sobe o servidor (por padrão o de desenvolvimento do Flask) apontando para o banco gerado
+por benchmarks.seed_data, dispara a mistura de cenários e informa p50/p95/p99,
+vazão e memória (RSS) do servidor. Com --compare, mostra a diferença para um baseline.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shlex
+import socket
+import tempfile
+import platform
+import argparse
+import threading
+import subprocess
+import http.client
+from urllib.parse import quote, urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SERVER = "{python} -m flask --app app run --port {port} --no-reload --no-debugger"
+
+DEFAULT_MIX = {
+    "list": 25,
+    "search": 20,
+    "filter": 15,
+    "paginate": 10,
+    "detail": 15,
+    "upload": 10,
+    "login": 4,
+    "register": 1,
+}
+
+
+class Client:
+    """Conexão HTTP/1.1 persistente de um cliente, reaberta se o servidor a fechar"""
+
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in (1, 2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Recorder:
+    """Guarda as latências (s) e o status de cada requisição, por cenário.
+
+    Amostras anteriores a `record_from` (aquecimento) são descartadas.
+    """
+
+    def __init__(self, record_from=0.0):
+        self.record_from = record_from
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def add(self, scenario, seconds, status):
+        if time.monotonic() < self.record_from:
+            return
+        with self.lock:
+            self.samples.setdefault(scenario, []).append((seconds, status))
+
+
+def percentile(sorted_values, p):
+    """Percentil com interpolação linear entre as amostras vizinhas"""
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(seconds for seconds, _ in samples)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / elapsed, 1),
+        "errors": sum(1 for _, status in samples if status is None or (status >= 400 and status != 503)),
+        "shed_503": sum(1 for _, status in samples if status == 503),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+class Scenarios:
+    """Requisições de cada cenário; cada uma é medida e registrada em `recorder`"""
+
+    def __init__(self, meta, recorder):
+        self.meta = meta
+        self.recorder = recorder
+        self.files = meta["images"] + meta["variants"]
+
+    def timed(self, scenario, client, method, path, body=None):
+        start = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            self.recorder.add(scenario, time.perf_counter() - start, None)
+            return None, None
+        self.recorder.add(scenario, time.perf_counter() - start, status)
+        return status, data
+
+    def list(self, client, rng):
+        self.timed("list", client, "GET", "/api/animals?limit=20")
+
+    def search(self, client, rng):
+        term = quote(rng.choice(self.meta["search_terms"]))
+        self.timed("search", client, "GET", f"/api/animals?query={term}&limit=20")
+
+    def filter(self, client, rng):
+        species = rng.choice(["cachorro", "gato", "outro"])
+        sex = rng.choice(["macho", "femea", ""])
+        self.timed("filter", client, "GET", f"/api/animals?species={species}&sex={sex}&limit=20")
+
+    def paginate(self, client, rng):
+        path = "/api/animals?limit=20&fields=id,name,image_url"
+        for _ in range(rng.randint(2, 6)):
+            status, data = self.timed("paginate", client, "GET", path)
+            if status != 200:
+                return
+            next_cursor = json.loads(data).get("next_cursor")
+            if not next_cursor:
+                return
+            path = f"/api/animals?limit=20&fields=id,name,image_url&after={next_cursor}"
+
+    def detail(self, client, rng):
+        low, high = self.meta["id_range"]
+        self.timed("detail", client, "GET", f"/api/animals/{rng.randint(low, high)}")
+
+    def upload(self, client, rng):
+        self.timed("upload", client, "GET", f"/api/uploads/{rng.choice(self.files)}")
+
+    def login(self, client, rng):
+        email = f"user{rng.randrange(self.meta['users'])}@bench.local"
+        self.timed("login", client, "POST", "/api/login", {"email": email, "password": self.meta["password"]})
+
+    def register(self, client, rng):
+        email = f"novo-{uuid.uuid4().hex}@bench.local"
+        self.timed("register", client, "POST", "/api/register", {"name": "Benchmark", "email": email, "password": "senha-nova"})
+
+
+def process_rss(pid):
+    """RSS (bytes) do processo e de seus filhos, lido de /proc (ou psutil, se instalado)"""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            proc = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [proc] + proc.children(recursive=True))
+        except psutil.Error:
+            return None
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            if current == pid:
+                return None
+    return total
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.values = []
+        self.stop = threading.Event()
+
+    def run(self):
+        while not self.stop.is_set():
+            rss = process_rss(self.pid)
+            if rss is not None:
+                self.values.append(rss)
+            self.stop.wait(self.interval)
+
+    def summary(self):
+        if not self.values:
+            return None
+        mb = lambda value: round(value / 1024 / 1024, 1)
+        return {"start_mb": mb(self.values[0]), "peak_mb": mb(max(self.values)), "end_mb": mb(self.values[-1])}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, port, env):
+    cmd = command.format(python=shlex.quote(sys.executable), port=port)
+    # Saída em arquivo, não em PIPE: um pipe cheio que ninguém lê trava o servidor no meio do teste
+    log = tempfile.TemporaryFile()
+    server = subprocess.Popen(shlex.split(cmd), cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f"Servidor encerrou ao iniciar:\n{log.read().decode(errors='replace')}")
+        try:
+            client = Client("127.0.0.1", port, timeout=2)
+            status, _ = client.request("GET", "/api/animals?limit=1")
+            client.close()
+            if status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("Servidor não respondeu em 60s")
+
+
+def run_load(host, port, meta, mix, clients, duration, warmup, seed):
+    # O aquecimento roda a mesma carga, mas as amostras dele são descartadas
+    recorder = Recorder(record_from=time.monotonic() + warmup)
+    scenarios = Scenarios(meta, recorder)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stop_at = time.monotonic() + warmup + duration
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        client = Client(host, port)
+        try:
+            while time.monotonic() < stop_at:
+                getattr(scenarios, rng.choices(names, weights)[0])(client, rng)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, duration
+
+
+def compare(result, baseline):
+    """Imprime a variação percentual de cada métrica em relação ao baseline"""
+    print(f"\n{'cenário':<10} {'métrica':<7} {'baseline':>10} {'atual':>10} {'variação':>9}")
+    worst = 0.0
+    for name, current in sorted(result["scenarios"].items()):
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            before, after = previous.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            # Para vazão, cair é que é ruim
+            regression = -change if metric == "rps" else change
+            worst = max(worst, regression)
+            print(f"{name:<10} {metric:<7} {before:>10} {after:>10} {change:>+8.1f}%")
+    return worst
+
+
+def parse_mix(raw):
+    mix = dict(DEFAULT_MIX)
+    if raw:
+        mix = {}
+        for part in raw.split(","):
+            name, _, weight = part.partition("=")
+            if name not in DEFAULT_MIX:
+                raise argparse.ArgumentTypeError(f"cenário desconhecido: {name}")
+            mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="bench.db", help="Banco gerado por benchmarks.seed_data")
+    parser.add_argument("--uploads", default="bench-uploads")
+    parser.add_argument("--url", help="Usa um servidor já rodando em vez de iniciar um")
+    parser.add_argument("--pid", type=int, help="PID do servidor de --url, para medir RSS")
+    parser.add_argument("--server", default=DEFAULT_SERVER, help="Comando do servidor ({python} e {port} são substituídos)")
+    parser.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR", help="Variável extra para o servidor")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=3, help="Segundos de carga descartados no início")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(None), help="Pesos, ex.: list=5,login=1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Grava o resultado em JSON (use como baseline depois)")
+    parser.add_argument("--compare", help="Baseline JSON para comparar")
+    parser.add_argument("--fail-over", type=float, help="Sai com erro se alguma métrica piorar mais que este percentual")
+    args = parser.parse_args(argv)
+
+    db_path = os.path.abspath(args.db)
+    with open(db_path + ".meta.json", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    server = None
+    pid = args.pid
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        env = {
+            **os.environ,
+            "DB_NAME": db_path,
+            "UPLOAD_FOLDER": os.path.abspath(args.uploads),
+            "BCRYPT_LOG_ROUNDS": str(meta["bcrypt_rounds"]),
+            "LOG_LEVEL": "WARNING",
+            # Todos os clientes saem do mesmo IP; o limitador mediria a si mesmo
+            "RATELIMIT_ENABLED": "false",
+        }
+        env.update(item.split("=", 1) for item in args.env)
+        server = start_server(args.server, port, env)
+        pid = server.pid
+
+    sampler = RssSampler(pid) if pid else None
+    if sampler:
+        sampler.start()
+    try:
+        started = time.perf_counter()
+        recorder, elapsed = run_load(host, port, meta, args.mix, args.clients, args.duration, args.warmup, args.seed)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    finally:
+        if sampler:
+            sampler.stop.set()
+            sampler.join()
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    all_samples = [sample for samples in recorder.samples.values() for sample in samples]
+    result = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "server": args.url or args.server,
+            "env": args.env,
+            "clients": args.clients,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "animals": meta["animals"],
+            "users": meta["users"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "total": summarize(all_samples, elapsed),
+        "scenarios": {name: summarize(samples, elapsed) for name, samples in sorted(recorder.samples.items())},
+        "rss": sampler.summary() if sampler else None,
+    }
+
+    print(f"{'cenário':<10} {'reqs':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'erros':>6} {'503':>5}")
+    for name, stats in list(result["scenarios"].items()) + [("TOTAL", result["total"])]:
+        print(f"{name:<10} {stats['requests']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>6} {stats['shed_503']:>5}")
+    if result["rss"]:
+        print(f"RSS do servidor: início {result['rss']['start_mb']} MB, pico {result['rss']['peak_mb']} MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            worst = compare(result, json.load(f))
+        if args.fail_over is not None and worst > args.fail_over:
+            print(f"\nRegressão de {worst:.1f}% acima do limite de {args.fail_over}%")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
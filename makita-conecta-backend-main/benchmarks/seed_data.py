@@ -0,0 +1,145 @@
+"""Gera um banco sintético para os benchmarks.
+
+    python -m benchmarks.seed_data --animals 100000 --users 1000 --db /tmp/bench.db
+
+Rode a partir da pasta do backend. Além do banco, grava `<db>.meta.json` com o que
+o load test precisa saber (faixa de ids, imagens, usuários e senha).
+"""
+import os
+import json
+import time
+import random
+import argparse
+import bcrypt
+from PIL import Image, ImageDraw
+import migrations
+from database import connect, current_settings
+from images import generate_variants
+
+PASSWORD = "senha-benchmark"
+
+NAMES = [
+    "Rex", "Mia", "Thor", "Luna", "Bidu", "Nina", "Toby", "Mel", "Bolinha", "Pipoca",
+    "Fred", "Lola", "Zeus", "Amora", "Simba", "Frida", "Paçoca", "Tom", "Bela", "Duque",
+]
+
+WORDS = [
+    "brincalhão", "dócil", "castrado", "vacinado", "filhote", "idoso", "siamês", "vira-lata",
+    "pelagem", "curta", "longa", "preto", "branco", "caramelo", "tigrado", "calmo", "energético",
+    "adora", "crianças", "apartamento", "quintal", "resgatado", "rua", "abrigo", "carinhoso",
+    "tímido", "porte", "pequeno", "médio", "grande", "labrador", "persa", "companheiro",
+]
+
+SPECIES = [("cachorro", 0.55), ("gato", 0.4), ("outro", 0.05)]
+SEXES = [("macho", 0.5), ("femea", 0.5)]
+
+BATCH_SIZE = 10_000
+
+
+def weighted(rng, choices):
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+
+def make_images(folder, count, rng):
+    """Cria fotos sintéticas de 1600x1200 e suas variantes; retorna [(arquivo, variantes)]"""
+    os.makedirs(folder, exist_ok=True)
+    result = []
+    for i in range(count):
+        filename = f"bench-{i:04d}.jpg"
+        image = Image.new("RGB", (1600, 1200), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(1600), rng.randrange(1200)
+            draw.ellipse((x, y, x + 200, y + 150), fill=tuple(rng.randrange(256) for _ in range(3)))
+        image.save(os.path.join(folder, filename), "JPEG", quality=85)
+        variants = generate_variants(folder, filename, max_pixels=40_000_000)
+        result.append((filename, json.dumps(variants)))
+    return result
+
+
+def build(db_path, uploads, animals, users, images, rounds, seed):
+    rng = random.Random(seed)
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    settings = {**current_settings(), "DB_NAME": db_path, "DB_SYNCHRONOUS": "OFF"}
+    conn = connect(settings)
+    migrations.upgrade(conn)
+
+    started = time.perf_counter()
+    # Um único hash para todos os usuários: o custo do bcrypt é medido no login, não aqui
+    password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (name, email, password) VALUES (?, ?, ?)",
+            ((f"Usuário {i}", f"user{i}@bench.local", password_hash) for i in range(users)),
+        )
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users")]
+
+    photos = make_images(uploads, images, rng)
+
+    def rows(count):
+        for _ in range(count):
+            filename, variants = rng.choice(photos)
+            yield (
+                f"{rng.choice(NAMES)} {rng.randrange(100000)}",
+                " ".join(rng.choices(WORDS, k=rng.randint(8, 30))),
+                filename,
+                variants,
+                weighted(rng, SPECIES),
+                weighted(rng, SEXES) if rng.random() > 0.05 else None,
+                rng.choice(user_ids),
+            )
+
+    remaining = animals
+    while remaining:
+        batch = min(BATCH_SIZE, remaining)
+        with conn:
+            conn.executemany("""
+                INSERT INTO animals (name, description, image_path, image_variants, species, sex, owner_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, rows(batch))
+        remaining -= batch
+
+    conn.execute("PRAGMA optimize")
+    ids = conn.execute("SELECT MIN(id), MAX(id) FROM animals").fetchone()
+    conn.close()
+
+    meta = {
+        "animals": animals,
+        "users": users,
+        "password": PASSWORD,
+        "bcrypt_rounds": rounds,
+        "id_range": [ids[0], ids[1]],
+        "images": [filename for filename, _ in photos],
+        "variants": [name for _, variants in photos for name in json.loads(variants).values()],
+        "search_terms": NAMES[:10] + WORDS[:10],
+        "seed": seed,
+        "build_seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(db_path + ".meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="bench.db", help="Arquivo do banco gerado (é recriado)")
+    parser.add_argument("--uploads", default="bench-uploads", help="Pasta das imagens sintéticas")
+    parser.add_argument("--animals", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--images", type=int, default=20, help="Fotos distintas compartilhadas pelos animais")
+    parser.add_argument("--rounds", type=int, default=12, help="Custo bcrypt das senhas dos usuários")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    meta = build(
+        os.path.abspath(args.db), os.path.abspath(args.uploads), args.animals, args.users,
+        args.images, args.rounds, args.seed,
+    )
+    print(f"{meta['animals']} animais e {meta['users']} usuários em {meta['build_seconds']}s -> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import io
+import os
+import csv
+import json
+import time
+import sqlite3
+import zipfile
+from werkzeug.datastructures import FileStorage
+from images import save_upload
+from lookups import normalize_species, normalize_sex
+
+FORMATS = ("ndjson", "csv")
+
+# Colunas aceitas na importação; só name é obrigatória
+IMPORT_FIELDS = ("name", "description", "species", "sex", "image")
+EXPORT_FIELDS = ("id", "name", "description", "species", "sex", "image", "created_at")
+
+MAX_NAME_LENGTH = 120
+MAX_DESCRIPTION_LENGTH = 5000
+
+
+def detect_format(filename, explicit=None):
+    """Formato pedido explicitamente ou deduzido da extensão do arquivo"""
+    fmt = (explicit or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt in ("jsonl", "json"):
+        fmt = "ndjson"
+    if fmt not in FORMATS:
+        raise ValueError("Formato nao suportado; use ndjson ou csv")
+    return fmt
+
+
+def iter_records(stream, fmt):
+    """Lê o arquivo linha a linha, gerando (número da linha, registro ou erro)"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"JSON invalido: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield line_no, ValueError("Cada linha deve ser um objeto JSON")
+            continue
+        yield line_no, record
+
+
+def _text(record, field):
+    value = record.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError(f"{field} deve ser texto")
+    return value.strip()
+
+
+class Importer:
+    """Valida registros e os insere em lotes, cada lote em uma transação.
+
+    Imagens vêm de URLs http(s) ou de arquivos dentro do zip `images`; as enviadas
+    no zip vão para o `storage` e são processadas depois pela fila de jobs. Se um lote
+    falhar, as imagens dele ficam sem referência e o GC do storage as recolhe.
+    """
+
+    def __init__(self, conn, owner_id, storage, images=None, batch_size=1000,
+                 max_errors=1000, image_max_bytes=None, job_max_attempts=5):
+        self.conn = conn
+        self.owner_id = owner_id
+        self.storage = storage
+        self.images = images
+        self.image_names = set(images.namelist()) if images else set()
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.image_max_bytes = image_max_bytes
+        self.job_max_attempts = job_max_attempts
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line_no, "error": message})
+
+    def validate(self, record):
+        """Converte um registro na tupla de INSERT, sem gravar nada; levanta ValueError"""
+        unknown = {str(key) for key in record if key not in IMPORT_FIELDS}
+        if unknown:
+            raise ValueError(f"Campos desconhecidos: {', '.join(sorted(unknown))}")
+
+        name = _text(record, "name")
+        if not name:
+            raise ValueError("name e obrigatorio")
+        if len(name) > MAX_NAME_LENGTH:
+            raise ValueError("name muito longo")
+
+        description = _text(record, "description") or None
+        if description and len(description) > MAX_DESCRIPTION_LENGTH:
+            raise ValueError("description muito longa")
+
+        species = normalize_species(_text(record, "species"))
+        if _text(record, "species") and species is None:
+            raise ValueError("Especie invalida")
+        sex = normalize_sex(_text(record, "sex"))
+        if _text(record, "sex") and sex is None:
+            raise ValueError("Sexo invalido")
+
+        image = _text(record, "image")
+        if image and not image.startswith(("http://", "https://")) and image not in self.image_names:
+            raise ValueError(f"Imagem nao encontrada no zip: {image}")
+        return name, description, image or None, species, sex
+
+    def _store_image(self, image):
+        """Copia a imagem do zip para o storage; URLs são gravadas como estão"""
+        if image is None or image.startswith(("http://", "https://")):
+            return image, "ready"
+        with self.images.open(image) as member:
+            key = save_upload(
+                FileStorage(stream=member, filename=os.path.basename(image)),
+                self.storage,
+                self.conn,
+                self.image_max_bytes or float("inf"),
+            )
+        return key, "pending"
+
+    def run(self, records):
+        """Consome (linha, registro) e retorna o resumo da importação"""
+        batch = []
+        for line_no, record in records:
+            if isinstance(record, Exception):
+                self.error(line_no, str(record))
+                continue
+            try:
+                name, description, image, species, sex = self.validate(record)
+                image_path, status = self._store_image(image)
+            except (ValueError, OSError, zipfile.BadZipFile) as e:
+                self.error(line_no, str(e))
+                continue
+            batch.append((line_no, (name, description, image_path, status, species, sex, self.owner_id)))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+    def _insert(self, rows):
+        self.conn.executemany("""
+            INSERT INTO animals (name, description, image_path, image_status, species, sex, owner_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def _flush(self, batch):
+        # BEGIN IMMEDIATE segura a escrita: os ids acima do último da tabela são todos deste lote
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM animals").fetchone()[0]
+            self.conn.execute("SAVEPOINT import_batch")
+            try:
+                self._insert([row for _, row in batch])
+                inserted = batch
+            except sqlite3.Error:
+                # Um registro ruim derrubou o lote: refaz linha a linha para apontar qual
+                self.conn.execute("ROLLBACK TO import_batch")
+                inserted = []
+                for item in batch:
+                    self.conn.execute("SAVEPOINT import_row")
+                    try:
+                        self._insert([item[1]])
+                        inserted.append(item)
+                    except sqlite3.Error as e:
+                        self.conn.execute("ROLLBACK TO import_row")
+                        self.error(item[0], str(e))
+                    self.conn.execute("RELEASE import_row")
+            self.conn.execute("RELEASE import_batch")
+
+            self.conn.execute("""
+                INSERT INTO jobs (kind, payload, max_attempts, run_after)
+                SELECT 'process_image', json_object('animal_id', id), ?, ?
+                FROM animals WHERE id > ? AND image_status = 'pending'
+            """, (self.job_max_attempts, time.time(), last_id))
+            self.conn.execute("""
+                INSERT INTO jobs (kind, payload, max_attempts, run_after)
+                SELECT 'index_similar', json_object('animal_id', id), ?, ?
+                FROM animals WHERE id > ?
+            """, (self.job_max_attempts, time.time(), last_id))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.imported += len(inserted)
+
+
+def iter_export(conn, fmt, image_url=None, species=None, sex=None, chunk_size=500):
+    """Gera o conteúdo da exportação em pedaços, lendo o banco aos poucos.
+
+    `image_url(image_path)` converte o caminho salvo na URL pública; sem ela sai o caminho.
+    """
+    clauses, params = [], []
+    if species:
+        clauses.append("species = ?")
+        params.append(species)
+    if sex:
+        clauses.append("sex = ?")
+        params.append(sex)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    cursor = conn.execute(f"""
+        SELECT id, name, description, species, sex, image_path, created_at
+        FROM animals {where} ORDER BY id
+    """, params)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row in rows:
+            record = dict(row)
+            image_path = record.pop("image_path")
+            record["image"] = image_url(image_path) if image_url else image_path
+            if writer:
+                writer.writerow([record[field] for field in EXPORT_FIELDS])
+            else:
+                buffer.write(json.dumps({field: record[field] for field in EXPORT_FIELDS}, ensure_ascii=False))
+                buffer.write("\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
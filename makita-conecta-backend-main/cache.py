@@ -0,0 +1,184 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, make_response, request
+from database import get_db
+
+# Maior resposta em streaming que o cache guarda
+TEE_MAX_BYTES = 1024 * 1024
+
+
+class MemoryBackend:
+    """Cache LRU com TTL em memória, com a mesma interface get/set/delete do redis-py"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+def create_backend(url, max_entries):
+    """memory:// usa o cache local do processo; redis:// compartilha entre processos"""
+    if url.startswith("memory://"):
+        return MemoryBackend(max_entries)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return redis.Redis.from_url(url)
+    raise ValueError(f"CACHE_URL não suportada: {url}")
+
+
+class GenerationMemo:
+    """Gerações lidas do banco, guardadas por `interval` segundos neste processo.
+
+    Assim um acerto no cache não precisa de conexão do pool nem de consulta. Escritas de
+    outros processos aparecem em até `interval` segundos; as deste processo limpam o memo.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, load):
+        now = time.monotonic()
+        with self._lock:
+            item = self._values.get(name)
+        if item is not None and item[0] > now:
+            return item[1]
+        value = load(name)
+        with self._lock:
+            self._values[name] = (now + self.interval, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+def init_app(app):
+    app.extensions["cache"] = create_backend(app.config["CACHE_URL"], app.config["CACHE_MAX_ENTRIES"])
+    memo = app.extensions["cache_generations"] = GenerationMemo(app.config["CACHE_GENERATION_INTERVAL"])
+
+    @app.after_request
+    def _forget_generations(response):
+        # Quem acabou de gravar vê a própria alteração na próxima leitura
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            memo.clear()
+        return response
+
+
+def get_backend():
+    return current_app.extensions["cache"]
+
+
+def current_generation(name):
+    """(geração, última alteração) da tabela `name`, memorizados por CACHE_GENERATION_INTERVAL"""
+    memo = current_app.extensions["cache_generations"]
+    if not memo.interval:
+        return _read_generation(name)
+    return memo.get(name, _read_generation)
+
+
+def _read_generation(name):
+    """Lê (geração, última alteração) mantidos pelos triggers da tabela `name`"""
+    row = get_db().execute(
+        "SELECT value, updated_at FROM cache_generations WHERE name = ?", (name,)
+    ).fetchone()
+    return (row["value"], row["updated_at"]) if row else (0, None)
+
+
+def cached_json(generation, key_func):
+    """Guarda a resposta JSON da view, invalidada quando a geração de `generation` muda.
+
+    `key_func()` deve devolver uma string com os parâmetros normalizados da requisição.
+    Respostas com status diferente de 200 não são guardadas. Respostas em streaming
+    seguem para o cliente sem esperar o fim e são guardadas quando terminam.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config["CACHE_ENABLED"]:
+                return view(*args, **kwargs)
+
+            version, updated_at = current_generation(generation)
+            key = f"{generation}:{version}:{request.host_url}:{request.path}:{key_func()}"
+            backend = get_backend()
+            ttl = current_app.config["CACHE_TTL"]
+
+            entry = backend.get(key)
+            hit = entry is not None
+            if hit:
+                etag, mimetype, body = entry.split(b"\n", 2)
+                etag, mimetype = etag.decode(), mimetype.decode()
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                mimetype = response.mimetype
+                if response.is_streamed:
+                    response.response = _tee(response.response, backend, key, mimetype, ttl)
+                    response.headers["X-Cache"] = "MISS"
+                    return response
+                body = response.get_data()
+                etag = _store(backend, key, mimetype, body, ttl)
+
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            if updated_at:
+                response.last_modified = updated_at
+            response.headers["X-Cache"] = "HIT" if hit else "MISS"
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def _store(backend, key, mimetype, body, ttl):
+    etag = hashlib.sha1(body).hexdigest()
+    backend.set(key, etag.encode() + b"\n" + mimetype.encode() + b"\n" + body, ex=ttl)
+    return etag
+
+
+def _tee(chunks, backend, key, mimetype, ttl):
+    """Repassa os pedaços ao cliente e guarda o corpo completo só se o envio terminar.
+
+    Corpos maiores que TEE_MAX_BYTES não são guardados, para não acumular a resposta inteira.
+    """
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if parts is not None:
+            size += len(chunk)
+            if size > TEE_MAX_BYTES:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        _store(backend, key, mimetype, b"".join(parts), ttl)
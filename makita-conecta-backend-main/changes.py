@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import bisect
+import sqlite3
+import threading
+from flask import current_app
+from database import connect
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+BACKLOG_LIMIT = 1000
+# Espera sugerida ao navegador antes de reconectar (ms)
+RETRY_MS = 3000
+# Falhas seguidas da consulta até os streams do processo serem encerrados
+FAILURES_BEFORE_CLOSE = 3
+# Espera máxima entre tentativas depois de uma falha (s)
+MAX_RETRY_DELAY = 30
+
+
+def format_event(change):
+    """Um evento SSE; o id permite retomar com Last-Event-ID ou since="""
+    change_id, animal_id, op, changed_at = change
+    data = json.dumps({"animal_id": animal_id, "op": op, "at": changed_at})
+    return f"id: {change_id}\nevent: {op}\ndata: {data}\n\n"
+
+
+class ChangeFeed:
+    """Distribui as linhas novas de animal_changes a todos os clientes SSE do processo.
+
+    Uma única thread consulta o banco, e só quando PRAGMA data_version indica que outra
+    conexão gravou algo; os clientes esperam numa Condition e leem de um buffer em
+    memória. Mil conexões abertas custam uma consulta por alteração, não mil por segundo.
+    """
+
+    def __init__(self, settings, pool, poll_interval, buffer_size, retention):
+        self.settings = settings
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _running(self):
+        return self._pid == os.getpid() and (self._thread.is_alive() or self._stop.is_set())
+
+    def _ensure_started(self):
+        # Criado no processo que atende (após o fork e o monkey patch do gevent, se houver)
+        # e recriado se a thread tiver morrido
+        if self._running():
+            return
+        with self._start_lock:
+            if self._running():
+                return
+            self._cond = threading.Condition()
+            self._stop = threading.Event()
+            self._failing = False
+            self._ids = []
+            self._events = []
+            conn = self.pool.acquire()
+            try:
+                self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM animal_changes").fetchone()[0]
+            finally:
+                self.pool.release(conn)
+            # Todas as alterações com id > _floor estão no buffer
+            self._floor = self._last_id
+            self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        conn = None
+        version = None
+        pruned = 0.0
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                try:
+                    if conn is None:
+                        conn = connect(self.settings)
+                        version = None
+                    current = conn.execute("PRAGMA data_version").fetchone()[0]
+                    if current != version:
+                        version = current
+                        rows = conn.execute(
+                            "SELECT id, animal_id, op, changed_at FROM animal_changes WHERE id > ? ORDER BY id LIMIT ?",
+                            (self._last_id, BACKLOG_LIMIT),
+                        ).fetchall()
+                        if rows:
+                            self._publish([tuple(row) for row in rows])
+                        if len(rows) == BACKLOG_LIMIT:
+                            version = None
+                            continue
+                    if failures:
+                        logger.info("feed de alterações recuperado", extra={"failures": failures})
+                        failures = 0
+                        self._set_failing(False)
+                    if time.monotonic() - pruned > 3600:
+                        pruned = time.monotonic()
+                        self._prune(conn)
+                    self._stop.wait(self.poll_interval)
+                except Exception:
+                    # Banco travado ou indisponível: tenta de novo com uma conexão nova
+                    failures += 1
+                    logger.exception("falha ao ler o feed de alterações", extra={"failures": failures})
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    if failures >= FAILURES_BEFORE_CLOSE:
+                        self._set_failing(True)
+                    self._stop.wait(min(self.poll_interval * 2 ** failures, MAX_RETRY_DELAY))
+        finally:
+            if conn is not None:
+                conn.close()
+            with self._cond:
+                self._cond.notify_all()
+
+    def _prune(self, conn):
+        # A poda é só limpeza: se o banco estiver ocupado, fica para a próxima hora
+        try:
+            with conn:
+                conn.execute("DELETE FROM animal_changes WHERE changed_at < ?", (time.time() - self.retention,))
+        except sqlite3.OperationalError as e:
+            logger.warning("poda do feed de alterações adiada", extra={"error": str(e)})
+
+    def _set_failing(self, failing):
+        """Sem conseguir ler o banco, os streams terminam e os clientes reconectam"""
+        with self._cond:
+            self._failing = failing
+            self._cond.notify_all()
+
+    def _publish(self, rows):
+        with self._cond:
+            self._ids.extend(row[0] for row in rows)
+            self._events.extend(rows)
+            overflow = len(self._ids) - self.buffer_size
+            if overflow > 0:
+                self._floor = self._ids[overflow - 1]
+                del self._ids[:overflow]
+                del self._events[:overflow]
+            self._last_id = rows[-1][0]
+            self._cond.notify_all()
+
+    def _wait_after(self, after_id, timeout):
+        """Alterações com id > after_id; [] no timeout, None se já saíram do buffer"""
+        with self._cond:
+            if after_id < self._floor:
+                return None
+            if self._last_id <= after_id:
+                self._cond.wait(timeout)
+            if after_id < self._floor:
+                return None
+            return self._events[bisect.bisect_right(self._ids, after_id):]
+
+    def _read_backlog(self, after_id):
+        """Lê do banco o que não cabe mais no buffer; None se o registro já foi podado"""
+        conn = self.pool.acquire()
+        try:
+            oldest = conn.execute("SELECT MIN(id) FROM animal_changes").fetchone()[0]
+            if oldest is not None and after_id < oldest - 1:
+                return None
+            rows = conn.execute(
+                "SELECT id, animal_id, op, changed_at FROM animal_changes WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, BACKLOG_LIMIT),
+            ).fetchall()
+            return [tuple(row) for row in rows]
+        finally:
+            self.pool.release(conn)
+
+    def stream(self, since, heartbeat, max_seconds):
+        """Gera o corpo text/event-stream a partir de `since` (ou do momento atual).
+
+        Comentários periódicos mantêm proxies e balanceadores sem fechar a conexão por
+        inatividade. Após `max_seconds` o stream termina e o navegador reconecta com
+        Last-Event-ID, o que reparte as conexões entre os workers.
+        """
+        self._ensure_started()
+        last = self._last_id if since is None else since
+        deadline = time.monotonic() + max_seconds
+        yield f"retry: {RETRY_MS}\n\n"
+
+        while not self._stop.is_set() and not self._failing and time.monotonic() < deadline:
+            events = self._wait_after(last, heartbeat)
+            if self._failing:
+                return
+            if events is None:
+                events = self._read_backlog(last)
+                if events is None:
+                    # O cliente ficou tempo demais desconectado: recarrega a lista inteira
+                    yield f"event: reset\ndata: {json.dumps({'last_id': self._last_id})}\n\n"
+                    return
+            if not events:
+                yield ": ping\n\n"
+                continue
+            for change in events:
+                yield format_event(change)
+            last = events[-1][0]
+
+    def stop(self):
+        if self._pid == os.getpid():
+            self._stop.set()
+            with self._cond:
+                self._cond.notify_all()
+
+
+def init_app(app):
+    config = app.config
+    app.extensions["changes"] = ChangeFeed(
+        config,
+        app.extensions["db_pool"],
+        poll_interval=config["CHANGES_POLL_INTERVAL"],
+        buffer_size=config["CHANGES_BUFFER_SIZE"],
+        retention=config["CHANGES_RETENTION"],
+    )
+
+
+def get_feed():
+    return current_app.extensions["changes"]
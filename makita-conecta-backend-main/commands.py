@@ -0,0 +1,247 @@
+import os
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from database import init_db, schema_status, get_db
+from storage import collect_garbage, get_storage
+from seed_animal import run_seed
+from migrations import latest_version
+import zipfile
+import jobs
+import bulk
+import backup
+import similar
+import mailer
+
+db_cli = AppGroup("db", help="Manutenção do banco de dados.")
+
+
+@db_cli.command("upgrade")
+def db_upgrade():
+    """Aplica as migrações pendentes do schema."""
+    applied, version = init_db()
+    if applied:
+        click.echo(f"Migrações aplicadas: {', '.join(map(str, applied))}")
+    click.echo(f"Schema na versão {version}.")
+
+
+@db_cli.command("version")
+def db_version():
+    """Mostra a versão atual e a esperada do schema."""
+    current, latest = schema_status()
+    click.echo(f"Versão atual: {current} / esperada: {latest}")
+
+
+@db_cli.command("backup")
+@click.option("--compact", is_flag=True, help="Usa VACUUM INTO: cópia menor, sem páginas livres, feita num passo só.")
+@click.option("--no-compress", is_flag=True, help="Grava o .db sem gzip.")
+@click.option("--keep", type=int, help="Cópias mantidas; as mais antigas são apagadas (padrão: BACKUP_KEEP, 0 = todas).")
+@click.option("--dir", "directory", type=click.Path(file_okay=False), help="Pasta das cópias (padrão: BACKUP_DIR).")
+def db_backup(compact, no_compress, keep, directory):
+    """Copia o banco sem parar a aplicação nem travar as escritas."""
+    config = current_app.config
+    try:
+        path = backup.create_backup(
+            config,
+            directory or config["BACKUP_DIR"],
+            compress=not no_compress,
+            compact=compact,
+            pages=config["BACKUP_STEP_PAGES"],
+            pause=config["BACKUP_STEP_PAUSE"],
+            keep=config["BACKUP_KEEP"] if keep is None else keep,
+        )
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Backup gravado em {path} ({os.path.getsize(path)} bytes).")
+
+
+@db_cli.command("backups")
+@click.option("--dir", "directory", type=click.Path(file_okay=False), help="Pasta das cópias (padrão: BACKUP_DIR).")
+def db_backups(directory):
+    """Lista as cópias existentes, da mais nova para a mais antiga."""
+    config = current_app.config
+    for path in backup.list_backups(directory or config["BACKUP_DIR"], config["DB_NAME"]):
+        click.echo(f"{path}  {os.path.getsize(path)} bytes")
+
+
+@db_cli.command("restore")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--yes", is_flag=True, help="Não pede confirmação.")
+def db_restore(path, yes):
+    """Substitui o banco pelo conteúdo de uma cópia (.db ou .db.gz)."""
+    if not yes:
+        click.confirm(f"Todo o conteúdo atual de {current_app.config['DB_NAME']} será substituído. Continuar?", abort=True)
+    try:
+        version = backup.restore_backup(current_app.config, path)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Banco restaurado de {path} (schema na versão {version}).")
+    if version < latest_version():
+        click.echo("A cópia tem um schema antigo: execute 'flask db upgrade'.")
+    click.echo("Reinicie a aplicação e os workers de jobs para descartar o estado em memória.")
+
+
+@click.command("seed")
+@with_appcontext
+def seed():
+    """Cadastra ou atualiza os animais de exemplo."""
+    novos, total = run_seed(get_db())
+    click.echo(f"Seed concluído: {novos} novos animais, {total} no total.")
+
+
+jobs_cli = AppGroup("jobs", help="Fila de processamento em segundo plano.")
+
+
+@jobs_cli.command("work")
+@click.option("--threads", default=2, show_default=True, help="Jobs processados em paralelo.")
+@click.option("--once", is_flag=True, help="Encerra quando não houver mais jobs prontos.")
+def jobs_work(threads, once):
+    """Processa a fila de jobs até Ctrl+C."""
+    click.echo(f"Worker iniciado com {threads} thread(s).")
+    jobs.work(current_app._get_current_object(), threads=threads, once=once)
+
+
+@jobs_cli.command("stats")
+def jobs_stats():
+    """Mostra quantos jobs existem em cada status."""
+    rows = get_db().execute("SELECT kind, status, COUNT(*) AS total FROM jobs GROUP BY kind, status").fetchall()
+    for row in rows:
+        click.echo(f"{row['kind']:<20} {row['status']:<10} {row['total']}")
+
+
+@jobs_cli.command("backfill-images")
+def jobs_backfill_images():
+    """Enfileira a geração de variantes para animais que ainda não as têm."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id FROM animals
+        WHERE image_variants IS NULL AND image_path IS NOT NULL AND image_path NOT LIKE 'http%'
+    """)
+    ids = [row['id'] for row in cursor.fetchall()]
+    for animal_id in ids:
+        jobs.enqueue(cursor, "process_image", {"animal_id": animal_id})
+    conn.commit()
+    click.echo(f"{len(ids)} job(s) enfileirado(s).")
+
+
+animals_cli = AppGroup("animals", help="Importação e exportação de animais em lote.")
+
+
+@animals_cli.command("import")
+@click.argument("source", type=click.File("rb"))
+@click.option("--owner", required=True, help="E-mail do usuário dono dos animais importados.")
+@click.option("--images", "images_path", type=click.Path(exists=True, dir_okay=False), help="Zip com as imagens citadas no arquivo.")
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS), help="Formato do arquivo (padrão: pela extensão).")
+def animals_import(source, owner, images_path, fmt):
+    """Importa animais de um arquivo NDJSON ou CSV ('-' lê da entrada padrão)."""
+    conn = get_db()
+    user = conn.execute("SELECT id FROM users WHERE email = ?", (owner,)).fetchone()
+    if user is None:
+        raise click.ClickException(f"Usuário não encontrado: {owner}")
+    try:
+        fmt = bulk.detect_format(source.name, fmt)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    config = current_app.config
+    images = zipfile.ZipFile(images_path) if images_path else None
+    try:
+        importer = bulk.Importer(
+            conn,
+            user["id"],
+            get_storage(),
+            images=images,
+            batch_size=config["IMPORT_BATCH_SIZE"],
+            max_errors=config["IMPORT_MAX_ERRORS"],
+            image_max_bytes=config["IMAGE_MAX_BYTES"],
+            job_max_attempts=config["JOBS_MAX_ATTEMPTS"],
+        )
+        summary = importer.run(bulk.iter_records(source, fmt))
+    finally:
+        if images:
+            images.close()
+
+    for error in summary["errors"]:
+        click.echo(f"linha {error['line']}: {error['error']}", err=True)
+    click.echo(f"{summary['imported']} importado(s), {summary['failed']} com erro.")
+
+
+@animals_cli.command("export")
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS), default="ndjson", show_default=True)
+@click.option("--output", "-o", type=click.File("w", encoding="utf-8"), default="-", help="Arquivo de saída (padrão: saída padrão).")
+def animals_export(fmt, output):
+    """Exporta todos os animais sem carregar a tabela inteira em memória."""
+    for chunk in bulk.iter_export(get_db(), fmt):
+        output.write(chunk)
+
+
+@animals_cli.command("similar-rebuild")
+def animals_similar_rebuild():
+    """Recalcula do zero o índice de animais parecidos (após importações grandes, por exemplo)."""
+    total = similar.rebuild(get_db(), similar.settings())
+    click.echo(f"{total} animal(is) indexado(s).")
+
+
+mail_cli = AppGroup("mail", help="Envio dos e-mails da outbox.")
+
+
+@mail_cli.command("send")
+@click.option("--once", is_flag=True, help="Encerra quando a outbox estiver vazia.")
+def mail_send(once):
+    """Envia os e-mails pendentes reaproveitando uma conexão SMTP."""
+    mailer.run_sender(current_app._get_current_object(), once=once)
+
+
+@mail_cli.command("stats")
+def mail_stats():
+    """Mostra quantos e-mails existem em cada status."""
+    for row in get_db().execute("SELECT status, COUNT(*) AS total FROM outbox GROUP BY status"):
+        click.echo(f"{row['status']:<10} {row['total']}")
+
+
+storage_cli = AppGroup("storage", help="Armazenamento das imagens enviadas.")
+
+
+@storage_cli.command("gc")
+@click.option("--batch-size", type=int, help="Blobs removidos por transação (padrão: STORAGE_GC_BATCH_SIZE).")
+@click.option("--max-batches", type=int, default=0, help="Para depois de N lotes (0 = até não sobrar órfão).")
+@click.option("--grace", type=float, help="Segundos sem referência antes de apagar (padrão: STORAGE_GC_GRACE).")
+def storage_gc(batch_size, max_batches, grace):
+    """Apaga as imagens que nenhum animal usa mais, em lotes curtos."""
+    config = current_app.config
+    batch_size = batch_size or config["STORAGE_GC_BATCH_SIZE"]
+    grace = config["STORAGE_GC_GRACE"] if grace is None else grace
+    conn, storage = get_db(), get_storage()
+    removed = batches = 0
+    while not max_batches or batches < max_batches:
+        count = collect_garbage(conn, storage, grace, batch_size)
+        removed += count
+        batches += 1
+        if count < batch_size:
+            break
+    click.echo(f"{removed} blob(s) removido(s).")
+
+
+@storage_cli.command("stats")
+def storage_stats():
+    """Mostra quantos blobs estão em uso e quantos aguardam o GC."""
+    row = get_db().execute("""
+        SELECT
+            SUM(refcount > 0) AS used,
+            COALESCE(SUM(CASE WHEN refcount > 0 THEN size END), 0) AS used_bytes,
+            SUM(refcount = 0) AS orphaned, SUM(refcount) AS refs
+        FROM blobs
+    """).fetchone()
+    click.echo(f"em uso: {row['used'] or 0} blob(s), {row['used_bytes']} bytes, {row['refs'] or 0} referência(s)")
+    click.echo(f"órfãos: {row['orphaned'] or 0}")
+
+
+def register_commands(app):
+    """Registra os comandos de linha de comando na aplicação"""
+    app.cli.add_command(db_cli)
+    app.cli.add_command(seed)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(mail_cli)
+    app.cli.add_command(animals_cli)
+    app.cli.add_command(storage_cli)
@@ -7,14 +7,155 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "chave-padrao-desenvolvimento")
-    UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+    UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(BASE_DIR, 'uploads'))
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 
-    DB_NAME = "database.db"
+    IMAGE_MAX_BYTES = int(os.environ.get("IMAGE_MAX_BYTES", 15 * 1024 * 1024))
+    IMAGE_MAX_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", 40_000_000))
     
-    MAIL_SERVER = "smtp-relay.brevo.com"
-    MAIL_PORT = 587
+    # "" (Flask envia os bytes), "x-sendfile" (Apache/lighttpd) ou "x-accel" (nginx)
+    UPLOADS_SENDFILE_MODE = os.environ.get("UPLOADS_SENDFILE_MODE", "")
+    UPLOADS_ACCEL_PREFIX = os.environ.get("UPLOADS_ACCEL_PREFIX", "/protected-uploads/")
+    UPLOADS_MAX_AGE = int(os.environ.get("UPLOADS_MAX_AGE", 365 * 24 * 3600))
+    USE_X_SENDFILE = UPLOADS_SENDFILE_MODE == "x-sendfile"
+    
+    # Vazia grava os blobs em UPLOAD_FOLDER; também aceita file:///caminho ou s3://bucket/prefixo
+    STORAGE_URL = os.environ.get("STORAGE_URL", "")
+    # Endpoint de um S3 compatível (ex.: MinIO em http://localhost:9000); vazio usa a AWS
+    STORAGE_S3_ENDPOINT = os.environ.get("STORAGE_S3_ENDPOINT", "")
+    STORAGE_S3_REGION = os.environ.get("STORAGE_S3_REGION", "")
+    STORAGE_URL_EXPIRES = int(os.environ.get("STORAGE_URL_EXPIRES", 3600))
+    # Segundos que um blob fica sem referências antes de o GC poder apagá-lo
+    STORAGE_GC_GRACE = float(os.environ.get("STORAGE_GC_GRACE", 3600))
+    STORAGE_GC_BATCH_SIZE = int(os.environ.get("STORAGE_GC_BATCH_SIZE", 500))
+    
+    JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 5))
+    JOBS_BACKOFF_BASE = float(os.environ.get("JOBS_BACKOFF_BASE", 5))
+    JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", 1))
+    JOBS_STALE_AFTER = float(os.environ.get("JOBS_STALE_AFTER", 300))
+    DB_NAME = os.environ.get("DB_NAME", "database.db")
+    DB_AUTO_MIGRATE = os.environ.get("DB_AUTO_MIGRATE", "false").lower() == "true"
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 8))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+    DB_BUSY_TIMEOUT = int(os.environ.get("DB_BUSY_TIMEOUT", 5000))
+    DB_SYNCHRONOUS = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE_KB = int(os.environ.get("DB_CACHE_SIZE_KB", 16384))
+    DB_MMAP_SIZE = int(os.environ.get("DB_MMAP_SIZE", 64 * 1024 * 1024))
+    # flask db backup: cópias mantidas e ritmo da cópia online (páginas por passo e pausa entre passos)
+    BACKUP_DIR = os.environ.get("BACKUP_DIR", os.path.join(BASE_DIR, "backups"))
+    BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", 7))
+    BACKUP_STEP_PAGES = int(os.environ.get("BACKUP_STEP_PAGES", 256))
+    BACKUP_STEP_PAUSE = float(os.environ.get("BACKUP_STEP_PAUSE", 0.01))
+    
+    ANIMALS_PAGE_SIZE = int(os.environ.get("ANIMALS_PAGE_SIZE", 20))
+    ANIMALS_MAX_PAGE_SIZE = int(os.environ.get("ANIMALS_MAX_PAGE_SIZE", 100))
+    # Feed SSE de /api/animals/changes
+    CHANGES_POLL_INTERVAL = float(os.environ.get("CHANGES_POLL_INTERVAL", 1))
+    CHANGES_BUFFER_SIZE = int(os.environ.get("CHANGES_BUFFER_SIZE", 1000))
+    CHANGES_RETENTION = float(os.environ.get("CHANGES_RETENTION", 7 * 24 * 3600))
+    CHANGES_HEARTBEAT = float(os.environ.get("CHANGES_HEARTBEAT", 15))
+    CHANGES_MAX_STREAM_SECONDS = float(os.environ.get("CHANGES_MAX_STREAM_SECONDS", 300))
+    # Ids aceitos por chamada de /api/animals/batch
+    ANIMALS_BATCH_MAX_IDS = int(os.environ.get("ANIMALS_BATCH_MAX_IDS", 1000))
+    # Animais parecidos: tamanho da lista guardada por animal e pesos de cada critério
+    SIMILAR_TOP_K = int(os.environ.get("SIMILAR_TOP_K", 20))
+    SIMILAR_WEIGHT_TEXT = float(os.environ.get("SIMILAR_WEIGHT_TEXT", 0.6))
+    SIMILAR_WEIGHT_SPECIES = float(os.environ.get("SIMILAR_WEIGHT_SPECIES", 0.3))
+    SIMILAR_WEIGHT_SEX = float(os.environ.get("SIMILAR_WEIGHT_SEX", 0.1))
+    # Termos presentes em mais dessa fração dos animais não servem para aproximar
+    SIMILAR_MAX_DF = float(os.environ.get("SIMILAR_MAX_DF", 0.5))
+    # Candidatos examinados (e listas atualizadas) ao indexar um animal novo
+    SIMILAR_FANOUT = int(os.environ.get("SIMILAR_FANOUT", 100))
+    IMPORT_MAX_BYTES = int(os.environ.get("IMPORT_MAX_BYTES", 512 * 1024 * 1024))
+    IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+    IMPORT_MAX_ERRORS = int(os.environ.get("IMPORT_MAX_ERRORS", 1000))
+    
+    CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_URL = os.environ.get("CACHE_URL", "memory://")
+    CACHE_TTL = int(os.environ.get("CACHE_TTL", 300))
+    CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 2048))
+    # Segundos que cada processo reaproveita a geração lida do banco; escritas feitas por
+    # outros processos levam até esse tempo para invalidar o cache (0 lê a cada requisição)
+    CACHE_GENERATION_INTERVAL = float(os.environ.get("CACHE_GENERATION_INTERVAL", 1))
+    # Segundos que id/nome/e-mail do usuário do token ficam no cache do processo (0 desliga).
+    # Cada worker tem o seu: alterações e exclusões chegam aos outros em até esse tempo
+    IDENTITY_CACHE_TTL = int(os.environ.get("IDENTITY_CACHE_TTL", 30))
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get("IDENTITY_CACHE_MAX_ENTRIES", 10_000))
+    
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+    REQUEST_TIMING = os.environ.get("REQUEST_TIMING", "false").lower() == "true"
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+    # Se definido, /metrics exige o cabeçalho "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    # Pasta onde cada processo grava suas métricas para o /metrics somar todos os workers
+    # (o gunicorn.conf.py define uma por padrão); vazio = só as do próprio processo
+    METRICS_DIR = os.environ.get("METRICS_DIR", "")
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 1))
+    
+    BCRYPT_LOG_ROUNDS = int(os.environ.get("BCRYPT_LOG_ROUNDS", 12))
+    # Processos dedicados ao bcrypt em cada processo web; 0 calcula o hash na própria thread
+    # da requisição. Por padrão as CPUs são divididas entre os WEB_WORKERS, para o total
+    # de processos de bcrypt não passar do número de CPUs
+    PASSWORD_WORKERS = int(os.environ.get(
+        "PASSWORD_WORKERS",
+        max(1, (os.cpu_count() or 1) // (int(os.environ.get("WEB_WORKERS", 0)) or os.cpu_count() or 1)),
+    ))
+    # Hashes em andamento + na fila antes de responder 503 (0 = 4 por worker)
+    PASSWORD_MAX_PENDING = int(os.environ.get("PASSWORD_MAX_PENDING", 0))
+    PASSWORD_QUEUE_TIMEOUT = float(os.environ.get("PASSWORD_QUEUE_TIMEOUT", 2))
+    PASSWORD_RETRY_AFTER = int(os.environ.get("PASSWORD_RETRY_AFTER", 2))
+    
+    RATELIMIT_ENABLED = os.environ.get("RATELIMIT_ENABLED", "true").lower() == "true"
+    # memory:// (por processo) ou sqlite:///caminho/ratelimit.db (compartilhado entre workers)
+    RATELIMIT_STORAGE = os.environ.get("RATELIMIT_STORAGE", "memory://")
+    RATELIMIT_MAX_KEYS = int(os.environ.get("RATELIMIT_MAX_KEYS", 100_000))
+    # Cada IP e cada usuário têm um balde com CAPACITY tokens, recarregado a REFILL_RATE tokens/s
+    RATELIMIT_CAPACITY = float(os.environ.get("RATELIMIT_CAPACITY", 60))
+    RATELIMIT_REFILL_RATE = float(os.environ.get("RATELIMIT_REFILL_RATE", 1))
+    # Tokens gastos por requisição em cada endpoint; os ausentes não são limitados e os
+    # maiores que RATELIMIT_CAPACITY valem a capacidade
+    RATELIMIT_COSTS = {
+        "auth.login_user": 5,
+        "auth.register_user": 10,
+        "auth.forgot_password": 15,
+        "auth.reset_password": 10,
+        "animals.create_animal": 10,
+        "animals.import_animals": 60,
+    }
+    # Quantos proxies (load balancer, nginx) ficam na frente da API; define de onde vem o IP do cliente
+    TRUSTED_PROXIES = int(os.environ.get("TRUSTED_PROXIES", 0))
+    
+    # Servidor de produção (gunicorn.conf.py / wsgi.py); 0 workers = um por CPU
+    WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:8000")
+    WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 0))
+    WEB_THREADS = int(os.environ.get("WEB_THREADS", 4))
+    # Vazio escolhe gthread/sync por WEB_THREADS; "gevent" para muitas conexões SSE ociosas
+    WEB_WORKER_CLASS = os.environ.get("WEB_WORKER_CLASS", "")
+    WEB_WORKER_CONNECTIONS = int(os.environ.get("WEB_WORKER_CONNECTIONS", 1000))
+    WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", 60))
+    WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+    WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", 5))
+    # Recicla cada worker após N requisições (0 desliga), com variação aleatória de até JITTER
+    WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", 0))
+    WEB_MAX_REQUESTS_JITTER = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", 0))
+    # Segundos em que /healthz responde com o último resultado sem consultar o banco
+    HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", 5))
+    
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtp-relay.brevo.com")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 587))
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "true").lower() == "true"
+    MAIL_USE_AUTH = os.environ.get("MAIL_USE_AUTH", "true").lower() == "true"
     MAIL_USERNAME = os.environ.get("BREVO_USERNAME")  
     MAIL_PASSWORD = os.environ.get("BREVO_PASSWORD")  
+    MAIL_TIMEOUT = float(os.environ.get("MAIL_TIMEOUT", 10))
+    MAIL_BATCH_SIZE = int(os.environ.get("MAIL_BATCH_SIZE", 50))
+    MAIL_MAX_ATTEMPTS = int(os.environ.get("MAIL_MAX_ATTEMPTS", 6))
+    MAIL_BACKOFF_BASE = float(os.environ.get("MAIL_BACKOFF_BASE", 10))
+    MAIL_POLL_INTERVAL = float(os.environ.get("MAIL_POLL_INTERVAL", 5))
+    MAIL_IDLE_TIMEOUT = float(os.environ.get("MAIL_IDLE_TIMEOUT", 30))
+    MAIL_STALE_AFTER = float(os.environ.get("MAIL_STALE_AFTER", 300))
+    # Envia a outbox numa thread do próprio processo web; desligue se rodar 'flask mail send' à parte
+    MAIL_BACKGROUND_SENDER = os.environ.get("MAIL_BACKGROUND_SENDER", "true").lower() == "true"
     MAIL_SENDER = "victorguimaraes980@gmail.com"
     MAIL_DEFAULT_SENDER = MAIL_SENDER  
     
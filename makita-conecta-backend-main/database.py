@@ -1,56 +1,154 @@
 import sqlite3
 import os
+import queue
+import threading
+from flask import g, current_app, has_app_context
 from config import Config
+import migrations
+import metrics
+
+
+class ConnectionPool:
+    """Pool limitado de conexões SQLite, seguro para uso entre threads"""
+
+    def __init__(self, settings, max_size, timeout):
+        self.settings = settings
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Conexões herdadas via fork (gunicorn com preload) pertencem ao processo pai:
+        # são abandonadas sem close(), que mexeria nos locks do arquivo usados por ele
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = queue.LifoQueue(maxsize=self.max_size)
+                self._created = 0
+                self._pid = os.getpid()
+
+    def acquire(self):
+        """Retorna uma conexão ociosa ou abre uma nova enquanto houver vaga"""
+        self._check_pid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return connect(self.settings)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Pool de conexões esgotado")
+
+    def release(self, conn):
+        """Devolve a conexão ao pool, descartando transações pendentes"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, queue.Full):
+            self._discard(conn)
+
+    def close_all(self):
+        """Fecha todas as conexões ociosas deste processo"""
+        self._check_pid()
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+def current_settings():
+    """Configuração da aplicação ativa ou, fora dela, os valores padrão de Config"""
+    if has_app_context():
+        return current_app.config
+    return {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+
+def connect(settings=None):
+    """Abre uma conexão com WAL e os pragmas de desempenho configurados"""
+    settings = settings or current_settings()
+    conn = sqlite3.connect(
+        settings["DB_NAME"],
+        timeout=settings["DB_BUSY_TIMEOUT"] / 1000,
+        check_same_thread=False,
+        factory=metrics.InstrumentedConnection if settings.get("METRICS_ENABLED") else sqlite3.Connection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {settings['DB_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings['DB_BUSY_TIMEOUT'])}")
+    conn.execute(f"PRAGMA cache_size = -{int(settings['DB_CACHE_SIZE_KB'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings['DB_MMAP_SIZE'])}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def init_app(app):
+    """Cria o pool de conexões da aplicação e devolve as conexões ao fim de cada contexto"""
+    app.extensions["db_pool"] = ConnectionPool(
+        app.config, app.config["DB_POOL_SIZE"], app.config["DB_POOL_TIMEOUT"]
+    )
+    app.teardown_appcontext(close_db)
+
+
+def get_pool():
+    """Retorna o pool de conexões da aplicação ativa"""
+    return current_app.extensions["db_pool"]
+
 
 def init_db():
-    """Inicializa o banco de dados com todas as tabelas necessárias"""
-    conn = sqlite3.connect(Config.DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS animals (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            image_path TEXT,
-            species TEXT,
-            sex TEXT,
-            owner_id INTEGER,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (owner_id) REFERENCES users (id) ON DELETE CASCADE
-        )
-    ''')
-    
+    """Aplica as migrações pendentes do schema"""
+    conn = connect()
     try:
-        cursor.execute("ALTER TABLE animals ADD COLUMN species TEXT")
-    except sqlite3.OperationalError:
-        pass
+        applied = migrations.upgrade(conn)
+        return applied, migrations.current_version(conn)
+    finally:
+        conn.close()
+
+def schema_status():
+    """Retorna (versão atual, versão esperada) sem criar nem alterar o arquivo do banco"""
+    db_name = current_settings()["DB_NAME"]
+    if not os.path.exists(db_name):
+        return 0, migrations.latest_version()
     
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
     try:
-        cursor.execute("ALTER TABLE animals ADD COLUMN sex TEXT")
-    except sqlite3.OperationalError:
-        pass
-    
-    conn.commit()
-    conn.close()
-    print("Banco de dados inicializado com sucesso!")
+        return migrations.current_version(conn), migrations.latest_version()
+    finally:
+        conn.close()
 
 def close_db(exception=None):
-    """Fecha a conexão com o banco"""
-    pass 
+    """Devolve ao pool a conexão usada no contexto atual"""
+    conn = g.pop("db", None)
+    if conn is not None:
+        get_pool().release(conn)
 
 def get_db():
-    """Retorna uma conexão com o banco de dados"""
-    conn = sqlite3.connect(Config.DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
\ No newline at end of file
+    """Retorna a conexão do contexto atual, obtida do pool"""
+    if "db" not in g:
+        g.db = get_pool().acquire()
+    return g.db
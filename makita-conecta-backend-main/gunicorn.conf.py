@@ -0,0 +1,67 @@
+"""Configuração do gunicorn, lida de config.Config (e portanto das variáveis de ambiente).
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Opções passadas na linha de comando (ex.: -b 127.0.0.1:9000) têm precedência.
+"""
+import os
+import shutil
+import tempfile
+
+# Os workers somam as métricas por esta pasta (ver metrics.MultiprocessStore); uma por
+# master, para dois servidores na mesma máquina não misturarem contagens
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"makita-metrics-{os.getpid()}"))
+
+from config import Config  # noqa: E402 (lê METRICS_DIR)
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS or os.cpu_count() or 1
+# Com threads o worker gthread atende várias requisições por processo; o SQLite em WAL
+# e o bcrypt em processos separados deixam o GIL livre durante a maior parte do tempo
+threads = Config.WEB_THREADS
+worker_class = Config.WEB_WORKER_CLASS or ("gthread" if threads > 1 else "sync")
+# Só usado por gevent: conexões simultâneas por worker, quase todas streams SSE ociosas
+worker_connections = Config.WEB_WORKER_CONNECTIONS
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+keepalive = Config.WEB_KEEPALIVE
+max_requests = Config.WEB_MAX_REQUESTS
+max_requests_jitter = Config.WEB_MAX_REQUESTS_JITTER
+
+# A aplicação é criada uma vez no master (check de schema e logs saem uma vez só);
+# o que depende de processo é recriado no worker na primeira vez em que é usado.
+# Com gevent ela é carregada no worker, depois do monkey patch.
+preload_app = worker_class != "gevent"
+
+accesslog = None
+errorlog = "-"
+loglevel = Config.LOG_LEVEL.lower()
+
+
+def post_worker_init(worker):
+    # No SIGTERM, fecha os streams SSE antes de esperar as requisições em andamento;
+    # sem isso o desligamento sempre levaria graceful_timeout
+    import signal
+    from wsgi import drain
+
+    def handle_term(sig, frame):
+        drain()
+        worker.handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    # Roda no próprio worker, depois de terminar as requisições em andamento
+    from wsgi import shutdown
+
+    shutdown(timeout=Config.WEB_GRACEFUL_TIMEOUT)
+
+
+def on_starting(server):
+    # Arquivos de uma execução anterior com o mesmo pid não são deste servidor
+    shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
+
+
+def on_exit(server):
+    shutil.rmtree(Config.METRICS_DIR, ignore_errors=True)
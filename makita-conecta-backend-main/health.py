@@ -0,0 +1,63 @@
+import time
+import threading
+from flask import jsonify
+import migrations
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+
+class Readiness:
+    """Estado de prontidão do processo, revalidado no banco no máximo a cada `interval` segundos.
+
+    Entre uma verificação e outra o probe só lê o resultado guardado, então um
+    balanceador consultando /healthz várias vezes por segundo não gera carga no SQLite.
+    """
+
+    def __init__(self, pool, interval):
+        self.pool = pool
+        self.interval = interval
+        self.draining = False
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._ready = False
+        self._reason = "não verificado"
+
+    def _check(self):
+        conn = self.pool.acquire()
+        try:
+            version = migrations.current_version(conn)
+        finally:
+            self.pool.release(conn)
+        latest = migrations.latest_version()
+        if version < latest:
+            return False, f"schema na versão {version}, esperada {latest}"
+        return True, None
+
+    def status(self):
+        """(pronto, motivo); só quem encontrar o resultado vencido consulta o banco"""
+        if self.draining:
+            return False, "encerrando"
+        now = time.monotonic()
+        if now - self._checked >= self.interval and self._lock.acquire(blocking=False):
+            try:
+                self._ready, self._reason = self._check()
+            except Exception as e:
+                self._ready, self._reason = False, f"banco indisponível: {e}"
+                logger.warning("verificação de prontidão falhou", extra={"error": repr(e)})
+            finally:
+                self._checked = now
+                self._lock.release()
+        return self._ready, self._reason
+
+
+def init_app(app):
+    """Registra /healthz, o probe de prontidão para balanceadores e orquestradores"""
+    readiness = app.extensions["health"] = Readiness(app.extensions["db_pool"], app.config["HEALTH_CHECK_INTERVAL"])
+
+    @app.route("/healthz")
+    def healthz():
+        ready, reason = readiness.status()
+        if ready:
+            return jsonify({"status": "ok"})
+        return jsonify({"status": "indisponivel", "reason": reason}), 503
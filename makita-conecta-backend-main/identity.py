@@ -0,0 +1,85 @@
+from functools import wraps
+from flask import current_app, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, get_current_user
+from cache import MemoryBackend
+from database import get_db
+
+jwt = JWTManager()
+
+USER_COLUMNS = "id, name, email"
+
+
+def init_app(app):
+    jwt.init_app(app)
+    # Cache próprio e pequeno, de cada processo: não disputa espaço com as respostas e
+    # o TTL curto limita quanto tempo os outros workers veem um nome ou e-mail antigo
+    app.extensions["identity_cache"] = MemoryBackend(app.config["IDENTITY_CACHE_MAX_ENTRIES"])
+
+
+def token_for(user, **kwargs):
+    """Token com o e-mail como identidade e o id do usuário na claim `uid`"""
+    return create_access_token(identity=user["email"], additional_claims={"uid": user["id"]}, **kwargs)
+
+
+def _cache_key(user_id):
+    return f"identity:{user_id}"
+
+
+def forget(user_id):
+    """Descarta a identidade guardada neste processo; chame após alterar ou excluir o usuário.
+
+    Os outros workers só a descartam quando o IDENTITY_CACHE_TTL vencer.
+    """
+    current_app.extensions["identity_cache"].delete(_cache_key(user_id))
+
+
+def load_user(user_id):
+    """Busca {id, name, email} do usuário, consultando o banco só quando não estiver em cache"""
+    ttl = current_app.config["IDENTITY_CACHE_TTL"]
+    backend = current_app.extensions["identity_cache"]
+    if ttl:
+        entry = backend.get(_cache_key(user_id))
+        if entry is not None:
+            return dict(entry)
+
+    row = get_db().execute(f"SELECT {USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+    if row is None:
+        return None
+    user = dict(row)
+    if ttl:
+        backend.set(_cache_key(user_id), dict(user), ex=ttl)
+    return user
+
+
+def user_must_exist(view):
+    """Confere no banco que o usuário do token ainda existe antes de rotas que gravam.
+
+    A identidade em cache de outro worker pode ser de uma conta já excluída.
+    Use abaixo de @jwt_required().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = get_current_user()["id"]
+        if get_db().execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone() is None:
+            forget(user_id)
+            return jsonify({"message": "Usuario nao encontrado"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@jwt.user_lookup_loader
+def _lookup_user(jwt_header, jwt_data):
+    """Resolve o `current_user` dos endpoints protegidos; None responde 401"""
+    email = jwt_data["sub"]
+    user_id = jwt_data.get("uid")
+    if user_id is None:
+        # Tokens emitidos antes da claim uid
+        row = get_db().execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        user_id = row["id"]
+
+    user = load_user(user_id)
+    if user is None or user["email"] != email:
+        return None
+    return user
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import tempfile
+from functools import lru_cache
+from flask import current_app
+from PIL import Image, ImageOps, features
+from jobs import handler
+from metrics import UPLOAD_BYTES, UPLOAD_DEDUPED, UPLOAD_SIZE
+from storage import blob_key, claim_blob, get_storage, variant_key
+
+CHUNK_SIZE = 64 * 1024
+
+# Lados máximos (px) de cada variante gerada a partir do original
+VARIANTS = {
+    "thumb": 160,
+    "card": 480,
+    "full": 1280,
+}
+
+
+class UploadError(ValueError):
+    """Upload recusado: tipo não suportado, arquivo vazio ou grande demais"""
+
+
+def detect_image_type(header):
+    """Identifica o formato pelos bytes iniciais do arquivo, ignorando a extensão"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def save_upload(file_storage, storage, conn, max_bytes):
+    """Copia o upload em blocos para um temporário, calculando o SHA-256, e o publica pelo hash.
+
+    O tipo é conferido no primeiro bloco, antes de gravar o restante. Um conteúdo já
+    armazenado não é gravado de novo. Retorna a chave do blob no storage.
+    """
+    first = file_storage.stream.read(CHUNK_SIZE)
+    ext = detect_image_type(first)
+    if ext is None:
+        raise UploadError("Tipo de arquivo não permitido")
+
+    fd, tmp_path = tempfile.mkstemp(dir=storage.temp_dir, suffix=".part")
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            chunk = first
+            while chunk:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError("Arquivo muito grande")
+                digest.update(chunk)
+                out.write(chunk)
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+
+        key = blob_key(digest.hexdigest(), ext)
+        UPLOAD_BYTES.inc(size)
+        UPLOAD_SIZE.observe(size)
+        # O registro vem antes do arquivo: assim o GC não apaga o blob entre os dois passos
+        claim_blob(conn, key, size)
+        if storage.exists(key):
+            UPLOAD_DEDUPED.inc()
+            os.unlink(tmp_path)
+        else:
+            storage.put_file(key, tmp_path)
+        return key
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def file_digest(path):
+    """SHA-256 do conteúdo de um arquivo; recalculado só se o tamanho ou mtime mudarem"""
+    stat = os.stat(path)
+    return _cached_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=4096)
+def _cached_digest(path, mtime_ns, size):
+    # hashlib.file_digest só existe a partir do Python 3.11
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def variant_format():
+    """WebP quando o Pillow tiver suporte, senão JPEG"""
+    return ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+
+def render_variants(source_path, out_dir, stem, max_pixels):
+    """Gera as variantes redimensionadas de `source_path` em `out_dir`.
+
+    Retorna {variante: nome do arquivo}.
+    """
+    fmt, ext = variant_format()
+    largest = max(VARIANTS.values())
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with Image.open(source_path) as source:
+            # Para JPEG, decodifica já em escala reduzida (bem mais rápido que abrir o original inteiro)
+            source.draft("RGB", (largest, largest))
+            image = ImageOps.exif_transpose(source)
+            image = image.convert("RGBA" if fmt == "WEBP" and "A" in image.getbands() else "RGB")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise UploadError(f"Imagem invalida: {e}")
+
+    variants = {}
+    # Da maior para a menor: cada variante reduz a anterior, não o original
+    for name, size in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.LANCZOS)
+        variant_name = f"{stem}_{name}.{ext}"
+        image.save(os.path.join(out_dir, variant_name), fmt, quality=80, method=4)
+        variants[name] = variant_name
+    return variants
+
+
+def generate_variants(folder, filename, max_pixels):
+    """Gera as variantes de uma imagem salva em `folder`, ao lado dela"""
+    return render_variants(os.path.join(folder, filename), folder, os.path.splitext(filename)[0], max_pixels)
+
+
+def store_variants(storage, key, max_pixels):
+    """Gera as variantes do blob `key` num temporário e as publica ao lado do original.
+
+    Retorna {variante: chave}.
+    """
+    variants = {}
+    with storage.local_path(key) as source, tempfile.TemporaryDirectory(dir=storage.temp_dir) as out:
+        for name, filename in render_variants(source, out, "variant", max_pixels).items():
+            variants[name] = variant_key(key, name, os.path.splitext(filename)[1][1:])
+            storage.put_file(variants[name], os.path.join(out, filename))
+    return variants
+
+
+def _mark_failed(conn, payload, error):
+    conn.execute("UPDATE animals SET image_status = 'failed' WHERE id = ?", (payload["animal_id"],))
+
+
+@handler("process_image", on_give_up=_mark_failed)
+def process_image(conn, payload):
+    """Job: gera as variantes da imagem de um animal e marca o status como pronto.
+
+    Se o mesmo conteúdo já foi processado para outro animal, reaproveita as variantes.
+    """
+    row = conn.execute("""
+        SELECT a.image_path, b.variants
+        FROM animals a LEFT JOIN blobs b ON b.key = a.image_path
+        WHERE a.id = ?
+    """, (payload["animal_id"],)).fetchone()
+    if row is None or not row["image_path"] or row["image_path"].startswith("http"):
+        return
+
+    variants = row["variants"]
+    if variants is None:
+        try:
+            variants = json.dumps(store_variants(
+                get_storage(), row["image_path"], current_app.config["IMAGE_MAX_PIXELS"]
+            ))
+        except UploadError:
+            # Arquivo corrompido não melhora com nova tentativa
+            _mark_failed(conn, payload, None)
+            return
+        conn.execute("UPDATE blobs SET variants = ? WHERE key = ?", (variants, row["image_path"]))
+
+    conn.execute(
+        "UPDATE animals SET image_variants = ?, image_status = 'ready' WHERE id = ?",
+        (variants, payload["animal_id"]),
+    )
@@ -0,0 +1,193 @@
+import json
+import random
+import threading
+import time
+from flask import current_app
+from database import connect
+from tracing import get_logger
+from metrics import JOB_DURATION
+
+logger = get_logger(__name__)
+
+HANDLERS = {}
+
+
+def handler(kind, on_give_up=None):
+    """Registra a função que processa jobs do tipo `kind`.
+
+    `on_give_up(conn, payload, error)` é chamada quando as tentativas se esgotam.
+    """
+    def decorator(func):
+        HANDLERS[kind] = (func, on_give_up)
+        return func
+    return decorator
+
+
+def enqueue(cursor, kind, payload, max_attempts=None):
+    """Enfileira um job; o commit fica com quem chama, junto da própria escrita"""
+    cursor.execute("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_after)
+        VALUES (?, ?, ?, ?)
+    """, (kind, json.dumps(payload), max_attempts or current_app.config["JOBS_MAX_ATTEMPTS"], time.time()))
+    return cursor.lastrowid
+
+
+def backoff(attempts, base, cap=3600):
+    """Espera exponencial com jitter antes da próxima tentativa"""
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim(conn):
+    """Reserva atomicamente o próximo job pronto para rodar, ou None"""
+    now = time.time()
+    with conn:
+        rows = conn.execute("""
+            UPDATE jobs
+            SET status = 'running', attempts = attempts + 1, locked_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE status = 'pending' AND run_after <= ?
+                ORDER BY run_after, id
+                LIMIT 1
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+        """, (now, now)).fetchall()
+    return rows[0] if rows else None
+
+
+def requeue_stale(conn, stale_after):
+    """Devolve à fila jobs presos em 'running' por um worker que morreu.
+
+    A tentativa interrompida já foi contada pelo claim. Os que esgotaram max_attempts
+    (um job que derruba o processo, por exemplo) falham em vez de voltar à fila.
+    Retorna quantos voltaram.
+    """
+    now = time.time()
+    with conn:
+        failed = conn.execute("""
+            UPDATE jobs SET status = 'failed', last_error = 'worker encerrado durante o job', locked_at = NULL
+            WHERE status = 'running' AND locked_at < ? AND attempts >= max_attempts
+            RETURNING id, kind, payload
+        """, (now - stale_after,)).fetchall()
+        for job in failed:
+            _, on_give_up = HANDLERS.get(job["kind"], (None, None))
+            if on_give_up is None:
+                continue
+            try:
+                on_give_up(conn, json.loads(job["payload"]), None)
+            except Exception:
+                logger.exception("falha ao descartar job travado", extra={"job": job["id"], "kind": job["kind"]})
+        cursor = conn.execute("""
+            UPDATE jobs SET status = 'pending', run_after = ?
+            WHERE status = 'running' AND locked_at < ?
+        """, (now, now - stale_after))
+    if failed:
+        logger.error("jobs travados descartados apos varias tentativas", extra={"count": len(failed)})
+    return cursor.rowcount
+
+
+def run_job(conn, job, backoff_base):
+    """Executa um job reservado e registra sucesso, nova tentativa ou falha definitiva.
+
+    As escritas do handler são confirmadas na mesma transação que marca o job como feito.
+    """
+    func, on_give_up = HANDLERS.get(job["kind"], (None, None))
+    payload = None
+    start = time.perf_counter()
+    try:
+        # Tipo desconhecido ou payload ilegível não melhoram com novas tentativas
+        if func is None:
+            raise LookupError(f"tipo de job desconhecido: {job['kind']}")
+        payload = json.loads(job["payload"])
+        func(conn, payload)
+    except Exception as e:
+        JOB_DURATION.observe(time.perf_counter() - start, kind=job["kind"], result="error")
+        if conn.in_transaction:
+            conn.rollback()
+        with conn:
+            if payload is None or job["attempts"] >= job["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, locked_at = NULL WHERE id = ?",
+                    (repr(e), job["id"]),
+                )
+                if on_give_up and payload is not None:
+                    on_give_up(conn, payload, e)
+                logger.exception("job falhou definitivamente", extra={"job": job["id"], "kind": job["kind"]})
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'pending', last_error = ?, locked_at = NULL, run_after = ? WHERE id = ?",
+                    (repr(e), time.time() + backoff(job["attempts"], backoff_base), job["id"]),
+                )
+                logger.warning(
+                    "job falhou; nova tentativa agendada",
+                    extra={"job": job["id"], "kind": job["kind"], "attempts": job["attempts"], "error": repr(e)},
+                )
+        return False
+
+    with conn:
+        conn.execute("UPDATE jobs SET status = 'done', locked_at = NULL WHERE id = ?", (job["id"],))
+    JOB_DURATION.observe(time.perf_counter() - start, kind=job["kind"], result="ok")
+    return True
+
+
+def work(app, threads=1, once=False):
+    """Roda workers até Ctrl+C; com `once`, para quando a fila esvaziar"""
+    stop = threading.Event()
+    config = app.config
+
+    def loop():
+        with app.app_context():
+            conn = connect()
+            try:
+                while not stop.is_set():
+                    job = claim(conn)
+                    if job is None:
+                        if once:
+                            return True
+                        stop.wait(config["JOBS_POLL_INTERVAL"])
+                        continue
+                    run_job(conn, job, config["JOBS_BACKOFF_BASE"])
+            finally:
+                conn.close()
+
+    def run_loop():
+        # Um erro fora do handler (banco travado ao reservar, por exemplo) não mata a
+        # thread; um job que tenha ficado em 'running' volta à fila pelo requeue_stale
+        while not stop.is_set():
+            try:
+                if loop():
+                    return
+            except Exception:
+                logger.exception("erro no worker de jobs; reabrindo a conexão")
+                stop.wait(config["JOBS_POLL_INTERVAL"])
+
+    def requeue():
+        # Jobs de um worker que morreu, deste ou de outro processo, voltam à fila
+        with app.app_context():
+            conn = connect()
+            try:
+                requeued = requeue_stale(conn, config["JOBS_STALE_AFTER"])
+            except Exception:
+                logger.exception("falha ao devolver jobs travados a fila")
+                requeued = 0
+            finally:
+                conn.close()
+        if requeued:
+            logger.info("jobs travados devolvidos a fila", extra={"count": requeued})
+
+    requeue()
+    workers = [threading.Thread(target=run_loop, name=f"job-worker-{i}", daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    next_requeue = time.monotonic() + config["JOBS_STALE_AFTER"] / 2
+    try:
+        while any(worker.is_alive() for worker in workers):
+            time.sleep(0.5)
+            if time.monotonic() >= next_requeue:
+                requeue()
+                next_requeue = time.monotonic() + config["JOBS_STALE_AFTER"] / 2
+    except KeyboardInterrupt:
+        stop.set()
+        for worker in workers:
+            worker.join()
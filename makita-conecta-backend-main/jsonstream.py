@@ -0,0 +1,56 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Tamanho a partir do qual o gerador entrega o que acumulou
+FLUSH_BYTES = 16 * 1024
+
+
+def dumps(obj):
+    """Serializa para bytes UTF-8 compactos, com orjson quando instalado"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def stream_page(rows, limit, serialize, cursor_for, key, ndjson=False, on_done=None):
+    """Gera uma página de resultados direto do cursor, sem montar a lista em memória.
+
+    `rows` deve trazer até limit + 1 linhas; a sobra indica que há próxima página e
+    `cursor_for(última linha enviada)` vira o next_cursor. Em JSON a saída é
+    {"<key>": [...], "next_cursor": ...}; em NDJSON, uma linha por item e, por último,
+    {"next_cursor": ...}. `on_done(total)` é chamada ao fim com o número de itens enviados.
+    """
+    count = 0
+    last = None
+    next_cursor = None
+    buffer = bytearray() if ndjson else bytearray(b'{"' + key.encode() + b'":[')
+
+    for row in rows:
+        if count == limit:
+            next_cursor = cursor_for(last)
+            break
+        if count and not ndjson:
+            buffer += b","
+        buffer += dumps(serialize(row))
+        if ndjson:
+            buffer += b"\n"
+        last = row
+        count += 1
+        # O primeiro item sai logo; depois agrupa em blocos para não escrever no socket a cada linha
+        if count == 1 or len(buffer) >= FLUSH_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+
+    if ndjson:
+        buffer += dumps({"next_cursor": next_cursor}) + b"\n"
+    else:
+        buffer += b'],"next_cursor":' + dumps(next_cursor) + b"}"
+    yield bytes(buffer)
+    if on_done is not None:
+        on_done(count)
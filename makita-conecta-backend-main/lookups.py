@@ -0,0 +1,54 @@
+import unicodedata
+
+SPECIES = {
+    "cachorro": "Cachorro",
+    "gato": "Gato",
+    "outro": "Outro",
+}
+
+SEXES = {
+    "macho": "Macho",
+    "femea": "Fêmea",
+}
+
+SPECIES_ALIASES = {
+    "cao": "cachorro",
+    "cachorra": "cachorro",
+    "cadela": "cachorro",
+    "dog": "cachorro",
+    "gata": "gato",
+    "cat": "gato",
+}
+
+SEX_ALIASES = {
+    "m": "macho",
+    "f": "femea",
+    "male": "macho",
+    "female": "femea",
+}
+
+
+def fold(value):
+    """Remove acentos, espaços extras e caixa de um texto livre"""
+    decomposed = unicodedata.normalize("NFKD", value.strip().lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalize_species(value):
+    """Converte texto livre ("Cão", "Gata"...) no código de espécie, ou None"""
+    if not value:
+        return None
+    folded = fold(value)
+    if folded in SPECIES:
+        return folded
+    return SPECIES_ALIASES.get(folded)
+
+
+def normalize_sex(value):
+    """Converte texto livre ("Fêmea", "F"...) no código de sexo, ou None"""
+    if not value:
+        return None
+    folded = fold(value)
+    if folded in SEXES:
+        return folded
+    return SEX_ALIASES.get(folded)
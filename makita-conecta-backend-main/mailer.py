@@ -0,0 +1,219 @@
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from flask import current_app
+from database import connect
+from jobs import backoff
+from tracing import get_logger
+from metrics import SMTP_DURATION
+
+logger = get_logger(__name__)
+
+_wakeup = threading.Event()
+_sender_thread = None
+_sender_lock = threading.Lock()
+_sender_stop = threading.Event()
+
+
+def is_configured(config):
+    """Há servidor SMTP e, se ele exigir autenticação, credenciais"""
+    if not config.get("MAIL_SERVER") or not config.get("MAIL_PORT"):
+        return False
+    if config.get("MAIL_USE_AUTH"):
+        return bool(config.get("MAIL_USERNAME") and config.get("MAIL_PASSWORD"))
+    return True
+
+
+def enqueue_email(cursor, to_email, subject, html_content):
+    """Grava o e-mail na outbox; o commit fica com quem chama"""
+    cursor.execute("""
+        INSERT INTO outbox (to_email, subject, html, max_attempts, run_after)
+        VALUES (?, ?, ?, ?, ?)
+    """, (to_email, subject, html_content, current_app.config["MAIL_MAX_ATTEMPTS"], time.time()))
+    return cursor.lastrowid
+
+
+def build_message(config, to_email, subject, html_content):
+    msg = MIMEMultipart()
+    msg['From'] = f"MakitaConecta <{config['MAIL_DEFAULT_SENDER']}>"
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(html_content, 'html'))
+    return msg
+
+
+class SmtpSender:
+    """Mantém uma conexão SMTP autenticada e a reabre quando o servidor a derruba"""
+
+    def __init__(self, config):
+        self.config = config
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.config["MAIL_SERVER"], self.config["MAIL_PORT"], timeout=self.config["MAIL_TIMEOUT"])
+        if self.config["MAIL_USE_TLS"]:
+            server.starttls()
+        if self.config["MAIL_USE_AUTH"]:
+            server.login(self.config["MAIL_USERNAME"], self.config["MAIL_PASSWORD"])
+        return server
+
+    def send(self, msg):
+        start = time.perf_counter()
+        result = "error"
+        try:
+            if self.server is None:
+                self.server = self._connect()
+            try:
+                self.server.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # A conexão reaproveitada pode ter expirado no servidor: reconecta uma vez
+                self.close()
+                self.server = self._connect()
+                self.server.send_message(msg)
+            result = "ok"
+        finally:
+            SMTP_DURATION.observe(time.perf_counter() - start, result=result)
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self, idle_timeout):
+        if self.server is not None and time.monotonic() - self.last_used > idle_timeout:
+            self.close()
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self.server = None
+
+
+def claim_batch(conn, limit):
+    """Reserva atomicamente até `limit` e-mails prontos para envio"""
+    now = time.time()
+    with conn:
+        return conn.execute("""
+            UPDATE outbox
+            SET status = 'sending', attempts = attempts + 1, locked_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status = 'pending' AND run_after <= ?
+                ORDER BY run_after, id
+                LIMIT ?
+            )
+            RETURNING id, to_email, subject, html, attempts, max_attempts
+        """, (now, now, limit)).fetchall()
+
+
+def deliver_batch(conn, sender, config):
+    """Envia um lote pela mesma conexão SMTP. Retorna quantos e-mails foram processados"""
+    batch = claim_batch(conn, config["MAIL_BATCH_SIZE"])
+    for row in batch:
+        try:
+            sender.send(build_message(config, row["to_email"], row["subject"], row["html"]))
+        except Exception as e:
+            # Erros de SMTP, de rede ou da própria mensagem (codificação, por exemplo)
+            sender.close()
+            with conn:
+                if row["attempts"] >= row["max_attempts"]:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'failed', last_error = ?, locked_at = NULL WHERE id = ?",
+                        (repr(e), row["id"]),
+                    )
+                    logger.error("e-mail descartado apos varias tentativas", extra={"outbox": row["id"], "error": repr(e)})
+                else:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'pending', last_error = ?, locked_at = NULL, run_after = ? WHERE id = ?",
+                        (repr(e), time.time() + backoff(row["attempts"], config["MAIL_BACKOFF_BASE"]), row["id"]),
+                    )
+                    logger.warning("falha ao enviar e-mail; nova tentativa agendada", extra={"outbox": row["id"], "error": repr(e)})
+            continue
+
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, locked_at = NULL WHERE id = ?",
+                (row["id"],),
+            )
+    return len(batch)
+
+
+def requeue_stale(conn, stale_after):
+    """Devolve à fila e-mails presos em 'sending' por um processo que morreu"""
+    with conn:
+        return conn.execute("""
+            UPDATE outbox SET status = 'pending', run_after = ?
+            WHERE status = 'sending' AND locked_at < ?
+        """, (time.time(), time.time() - stale_after)).rowcount
+
+
+def run_sender(app, once=False, stop=None):
+    """Esvazia a outbox continuamente; com `once`, para quando não houver mais nada pronto.
+
+    Um erro inesperado (banco travado, por exemplo) não encerra o envio: a conexão é
+    reaberta após uma espera crescente. E-mails presos em 'sending' voltam à fila a
+    cada MAIL_STALE_AFTER/2 segundos, não só ao iniciar.
+    """
+    config = app.config
+    stop = stop or threading.Event()
+    sender = SmtpSender(config)
+    conn = None
+    next_requeue = 0.0
+    failures = 0
+    try:
+        while not stop.is_set():
+            try:
+                if conn is None:
+                    with app.app_context():
+                        conn = connect()
+                if time.monotonic() >= next_requeue:
+                    requeued = requeue_stale(conn, config["MAIL_STALE_AFTER"])
+                    if requeued:
+                        logger.info("e-mails travados devolvidos a fila", extra={"count": requeued})
+                    next_requeue = time.monotonic() + config["MAIL_STALE_AFTER"] / 2
+                _wakeup.clear()
+                sent = deliver_batch(conn, sender, config)
+                failures = 0
+                if sent:
+                    continue
+                if once:
+                    break
+                sender.close_if_idle(config["MAIL_IDLE_TIMEOUT"])
+                _wakeup.wait(config["MAIL_POLL_INTERVAL"])
+            except Exception:
+                failures += 1
+                logger.exception("erro no envio de e-mails; reabrindo a conexão")
+                sender.close()
+                if conn is not None:
+                    conn.close()
+                    conn = None
+                stop.wait(backoff(failures, config["MAIL_POLL_INTERVAL"], cap=60))
+    finally:
+        sender.close()
+        if conn is not None:
+            conn.close()
+
+
+def notify_sender(app):
+    """Acorda o sender deste processo, iniciando-o na primeira vez se configurado"""
+    global _sender_thread
+    if app.config["MAIL_BACKGROUND_SENDER"]:
+        with _sender_lock:
+            if _sender_thread is None or not _sender_thread.is_alive():
+                _sender_thread = threading.Thread(
+                    target=run_sender, args=(app, False, _sender_stop), name="mail-sender", daemon=True
+                )
+                _sender_thread.start()
+    _wakeup.set()
+
+
+def stop_sender(timeout=None):
+    """Pede ao sender deste processo que pare após o lote atual e espera por ele"""
+    _sender_stop.set()
+    _wakeup.set()
+    thread = _sender_thread
+    if thread is not None and thread.is_alive():
+        thread.join(timeout)
@@ -0,0 +1,420 @@
+import os
+import re
+import json
+import math
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from flask import Response, abort, g, request
+from tracing import get_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: o waitress roda num processo só
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Limites (s) dos histogramas de latência, no formato de exposição do Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotônico com rótulos, seguro entre threads"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def export(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    @staticmethod
+    def combine(into, key, value):
+        into[key] = into.get(key, 0) + value
+
+    def samples(self, values=None):
+        items = (self.export() if values is None else values).items()
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Histograma com limites fixos; guarda só contagens por faixa, soma e total"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def export(self):
+        with self._lock:
+            return {key: [list(state[0]), state[1], state[2]] for key, state in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    @staticmethod
+    def combine(into, key, value):
+        state = into.get(key)
+        if state is None:
+            into[key] = [list(value[0]), value[1], value[2]]
+            return
+        state[0] = [a + b for a, b in zip(state[0], value[0])]
+        state[1] += value[1]
+        state[2] += value[2]
+
+    def samples(self, values=None):
+        items = (self.export() if values is None else values).items()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_number(bound))]), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), count
+
+
+def render(combined=None):
+    """Todas as métricas no formato texto do Prometheus.
+
+    `combined` (nome -> valores) substitui os valores deste processo; é o que
+    MultiprocessStore.collect devolve.
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        values = None if combined is None else combined.get(metric.name, {})
+        for name, labels, value in metric.samples(values):
+            lines.append(f"{name}{labels} {_format_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _reset_after_fork():
+    # O que o master do gunicorn mediu antes do fork não é de nenhum worker
+    for metric in REGISTRY:
+        metric.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessStore:
+    """Soma as métricas de todos os processos que gravam no mesmo diretório.
+
+    Com vários workers do gunicorn, cada um só conhece as próprias contagens e o scrape
+    cai num worker qualquer. Aqui cada processo grava um instantâneo num arquivo seu a
+    cada `interval` segundos, e o /metrics de qualquer worker soma todos. Os arquivos
+    de processos que terminaram (max_requests, reload) são somados num acumulado, para
+    os contadores nunca voltarem atrás.
+    """
+
+    DEAD = "dead.json"
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Um arquivo e uma thread por processo, criados depois do fork
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            # O uuid evita herdar o arquivo de um processo antigo com o mesmo pid
+            self._path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex}.json")
+            self._stop = threading.Event()
+            threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("falha ao gravar as métricas do processo")
+
+    def flush(self):
+        """Grava o instantâneo deste processo (troca atômica do arquivo)"""
+        if self._pid != os.getpid():
+            return
+        data = {metric.name: [[list(key), value] for key, value in metric.export().items()] for metric in REGISTRY}
+        partial = f"{self._path}.{threading.get_ident()}.tmp"
+        with open(partial, "w") as f:
+            json.dump(data, f)
+        os.replace(partial, self._path)
+
+    def stop(self):
+        """Última gravação ao encerrar o processo"""
+        if self._pid == os.getpid():
+            self._stop.set()
+            self.flush()
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def collect(self):
+        """Soma os instantâneos de todos os processos; nome -> valores"""
+        self._ensure_started()
+        self.flush()
+        metrics = {metric.name: metric for metric in REGISTRY}
+        combined = {name: {} for name in metrics}
+
+        def add(into, data):
+            for name, entries in data.items():
+                metric = metrics.get(name)
+                if metric is None:
+                    continue
+                target = into.setdefault(name, {})
+                for key, value in entries:
+                    metric.combine(target, tuple(key), value)
+
+        # Sob o lock, para a compactação não somar um arquivo duas vezes
+        with self._locked():
+            dead_path = os.path.join(self.directory, self.DEAD)
+            dead = _read_json(dead_path) or {}
+            finished = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json") or name == self.DEAD:
+                    continue
+                path = os.path.join(self.directory, name)
+                data = _read_json(path)
+                if data is None:
+                    continue
+                if _pid_alive(int(name.split("-", 1)[0])):
+                    add(combined, data)
+                else:
+                    finished.append((path, data))
+
+            if finished:
+                merged = {}
+                add(merged, dead)
+                for _, data in finished:
+                    add(merged, data)
+                dead = {name: [[list(key), value] for key, value in values.items()] for name, values in merged.items()}
+                partial = dead_path + ".tmp"
+                with open(partial, "w") as f:
+                    json.dump(dead, f)
+                os.replace(partial, dead_path)
+                for path, _ in finished:
+                    os.unlink(path)
+            add(combined, dead)
+        return combined
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+REQUEST_DURATION = Histogram(
+    "makita_http_request_duration_seconds", "Duração das requisições por endpoint", ("endpoint", "method")
+)
+REQUESTS = Counter(
+    "makita_http_requests_total", "Requisições por endpoint e status", ("endpoint", "method", "status")
+)
+SQL_DURATION = Histogram(
+    "makita_sql_query_duration_seconds", "Tempo de execute/executemany por operação e tabela", ("operation", "table")
+)
+PASSWORD_DURATION = Histogram(
+    "makita_password_hash_seconds", "Tempo de bcrypt, incluindo a espera por vaga no pool", ("operation",)
+)
+PASSWORD_SHED = Counter(
+    "makita_password_shed_total", "Requisições recusadas com 503 por falta de vaga no pool de hash"
+)
+SMTP_DURATION = Histogram("makita_smtp_send_seconds", "Tempo de envio de um e-mail", ("result",))
+UPLOAD_BYTES = Counter("makita_upload_bytes_total", "Bytes de imagens recebidas e salvas")
+UPLOAD_DEDUPED = Counter("makita_upload_deduped_total", "Uploads cujo conteúdo já estava armazenado")
+UPLOAD_SIZE = Histogram("makita_upload_size_bytes", "Tamanho das imagens recebidas", buckets=SIZE_BUCKETS)
+JOB_DURATION = Histogram(
+    "makita_job_duration_seconds", "Duração dos jobs da fila", ("kind", "result")
+)
+RATELIMIT_REJECTED = Counter(
+    "makita_ratelimit_rejected_total", "Requisições recusadas com 429 pelo limitador", ("endpoint", "scope")
+)
+
+
+_SQL_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+def _classify(sql):
+    """(operação, tabela principal) de um comando SQL, com cardinalidade limitada"""
+    words = sql.lstrip().split(None, 1)
+    operation = words[0].upper() if words else "?"
+    if operation not in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"):
+        operation = "OTHER"
+    match = _SQL_TABLE.search(sql)
+    return operation, match.group(1).lower() if match else ""
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor que mede o tempo de execute/executemany (a leitura das linhas fica de fora)"""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            operation, table = _classify(sql)
+            SQL_DURATION.observe(time.perf_counter() - start, operation=operation, table=table)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            operation, table = _classify(sql)
+            SQL_DURATION.observe(time.perf_counter() - start, operation=operation, table=table)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexão cujos cursores são medidos.
+
+    O conn.execute nativo cria o cursor sem passar por cursor(), por isso é refeito aqui.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _start_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _finish_request(response):
+    start = g.pop("metrics_start", None)
+    if start is None:
+        return response
+    # Rotas inexistentes viram um único rótulo, para não criar uma série por URL
+    endpoint = request.endpoint or "unmatched"
+    method = request.method
+    status = str(response.status_code)
+
+    def observe():
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint, method=method)
+        REQUESTS.inc(endpoint=endpoint, method=method, status=status)
+
+    if response.is_streamed:
+        response.call_on_close(observe)
+    else:
+        observe()
+    return response
+
+
+def init_app(app):
+    """Mede as requisições e expõe /metrics, se METRICS_ENABLED"""
+    if not app.config["METRICS_ENABLED"]:
+        return
+    store = None
+    if app.config["METRICS_DIR"]:
+        store = MultiprocessStore(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+        app.extensions["metrics_store"] = store
+        app.before_request(store._ensure_started)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    token = app.config["METRICS_TOKEN"]
+
+    @app.route("/metrics")
+    def metrics():
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(render(store.collect() if store else None), content_type=CONTENT_TYPE)
@@ -0,0 +1,415 @@
+from lookups import SPECIES, SEXES, normalize_species, normalize_sex
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Registra uma migração numerada; as versões devem ser sequenciais"""
+    def decorator(func):
+        assert version == len(MIGRATIONS) + 1, f"migração {version} fora de ordem"
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+
+def latest_version():
+    return len(MIGRATIONS)
+
+
+def current_version(conn):
+    """Lê a versão do schema gravada em PRAGMA user_version"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(conn):
+    """Aplica as migrações pendentes, cada uma em sua própria transação"""
+    applied = []
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for version, description, func in MIGRATIONS:
+            if current_version(conn) >= version:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Outro processo pode ter aplicado a migração enquanto esperávamos o lock
+                if current_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                func(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            logger.info("migracao aplicada", extra={"version": version, "description": description})
+            applied.append(version)
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+def _columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in cursor.fetchall()}
+
+
+@migration(1, "tabelas users e animals")
+def _schema_inicial(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS animals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            image_path TEXT,
+            species TEXT,
+            sex TEXT,
+            owner_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (owner_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Bancos criados antes das colunas de filtro existirem
+    columns = _columns(cursor, "animals")
+    for column in ("species", "sex"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE animals ADD COLUMN {column} TEXT")
+
+
+@migration(2, "índice FTS5 de nome/descrição")
+def _indice_busca(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'animals_fts'")
+    exists = cursor.fetchone() is not None
+
+    # remove_diacritics faz "Siamês" e "siames" gerarem o mesmo token
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts USING fts5(
+            name,
+            description,
+            content='animals',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_fts_insert AFTER INSERT ON animals BEGIN
+            INSERT INTO animals_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_fts_delete AFTER DELETE ON animals BEGIN
+            INSERT INTO animals_fts (animals_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_fts_update AFTER UPDATE OF name, description ON animals BEGIN
+            INSERT INTO animals_fts (animals_fts, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO animals_fts (rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    ''')
+
+    if not exists:
+        # Nome pesa mais que descrição no ranking; rebuild indexa as linhas já existentes
+        cursor.execute("INSERT INTO animals_fts (animals_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+        cursor.execute("INSERT INTO animals_fts (animals_fts) VALUES ('rebuild')")
+
+
+def _normalizar_coluna(cursor, column, normalize, fallback):
+    """Troca cada valor distinto de `column` pelo seu código, registrando o que mudou"""
+    cursor.execute(f"SELECT {column}, COUNT(*) FROM animals WHERE {column} IS NOT NULL GROUP BY {column}")
+    for value, rows in cursor.fetchall():
+        code = normalize(value)
+        if code == value:
+            continue
+        if code is None:
+            code = fallback
+            logger.warning("valor desconhecido substituido", extra={"column": column, "value": value, "code": code, "rows": rows})
+        else:
+            logger.info("valor convertido em codigo", extra={"column": column, "value": value, "code": code, "rows": rows})
+        cursor.execute(f"UPDATE animals SET {column} = ? WHERE {column} = ?", (code, value))
+
+
+@migration(3, "códigos normalizados de espécie e sexo")
+def _codigos_especie_sexo(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS species (
+            code TEXT PRIMARY KEY,
+            label TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sexes (
+            code TEXT PRIMARY KEY,
+            label TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.executemany("INSERT OR IGNORE INTO species (code, label) VALUES (?, ?)", SPECIES.items())
+    cursor.executemany("INSERT OR IGNORE INTO sexes (code, label) VALUES (?, ?)", SEXES.items())
+
+    # Converte textos livres antigos ("Cachorro", "Fêmea") nos códigos das tabelas.
+    # Valores irreconhecíveis vão para o código genérico de cada coluna: "outro" na
+    # espécie e NULL (indefinido) no sexo, que não tem um código equivalente
+    _normalizar_coluna(cursor, "species", normalize_species, "outro")
+    _normalizar_coluna(cursor, "sex", normalize_sex, None)
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_codes_insert BEFORE INSERT ON animals
+        WHEN (new.species IS NOT NULL AND new.species NOT IN (SELECT code FROM species))
+          OR (new.sex IS NOT NULL AND new.sex NOT IN (SELECT code FROM sexes))
+        BEGIN
+            SELECT RAISE(ABORT, 'especie ou sexo invalido');
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_codes_update BEFORE UPDATE OF species, sex ON animals
+        WHEN (new.species IS NOT NULL AND new.species NOT IN (SELECT code FROM species))
+          OR (new.sex IS NOT NULL AND new.sex NOT IN (SELECT code FROM sexes))
+        BEGIN
+            SELECT RAISE(ABORT, 'especie ou sexo invalido');
+        END
+    ''')
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_animals_species_sex_id ON animals (species, sex, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_animals_species_id ON animals (species, id DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_animals_sex_id ON animals (sex, id DESC)")
+
+
+@migration(4, "chave de seed para upsert em lote")
+def _chave_seed(cursor):
+    if "seed_key" not in _columns(cursor, "animals"):
+        cursor.execute("ALTER TABLE animals ADD COLUMN seed_key TEXT")
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_animals_seed_key
+        ON animals (seed_key) WHERE seed_key IS NOT NULL
+    ''')
+
+
+@migration(5, "variantes redimensionadas das imagens")
+def _variantes_imagem(cursor):
+    if "image_variants" not in _columns(cursor, "animals"):
+        cursor.execute("ALTER TABLE animals ADD COLUMN image_variants TEXT")
+
+
+@migration(6, "fila de jobs e status de processamento da imagem")
+def _fila_jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            locked_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (run_after, id) WHERE status = 'pending'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running'")
+
+    if "image_status" not in _columns(cursor, "animals"):
+        cursor.execute('''
+            ALTER TABLE animals ADD COLUMN image_status TEXT NOT NULL DEFAULT 'ready'
+                CHECK (image_status IN ('pending', 'ready', 'failed'))
+        ''')
+
+
+@migration(7, "contador de geração para invalidar o cache de respostas")
+def _geracao_cache(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO cache_generations (name, value, updated_at)
+        VALUES ('animals', 0, CAST(strftime('%s', 'now') AS INTEGER))
+    ''')
+
+    # Toda escrita em animals, venha de onde vier, invalida as respostas guardadas
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS animals_generation_{event.lower()} AFTER {event} ON animals BEGIN
+                UPDATE cache_generations
+                SET value = value + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'animals';
+            END
+        ''')
+
+
+@migration(8, "outbox de e-mails")
+def _outbox(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            locked_at REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (run_after, id) WHERE status = 'pending'")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_sending ON outbox (locked_at) WHERE status = 'sending'")
+
+
+@migration(9, "blobs endereçados por conteúdo com contagem de referências")
+def _blobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            key TEXT PRIMARY KEY,
+            size INTEGER,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            variants TEXT,
+            orphaned_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # O GC percorre só este índice, que contém apenas os blobs sem referência
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_orphaned ON blobs (orphaned_at) WHERE refcount = 0")
+
+    # Uploads antigos (prefixo UUID) passam a ser contados; as imagens do seed ficam de fora
+    cursor.execute('''
+        INSERT OR IGNORE INTO blobs (key, refcount, variants)
+        SELECT image_path, COUNT(*), MAX(image_variants)
+        FROM animals
+        WHERE image_path GLOB '[0-9a-f][0-9a-f][0-9a-f][0-9a-f][0-9a-f][0-9a-f][0-9a-f][0-9a-f]-*_*'
+        GROUP BY image_path
+    ''')
+
+    # Só blobs já registrados são afetados: URLs e imagens do seed não têm linha em blobs
+    now = "(julianday('now') - 2440587.5) * 86400.0"
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_blobs_insert AFTER INSERT ON animals
+        WHEN new.image_path IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount + 1, orphaned_at = NULL WHERE key = new.image_path;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS animals_blobs_delete AFTER DELETE ON animals
+        WHEN old.image_path IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount - 1, orphaned_at = CASE WHEN refcount <= 1 THEN {now} END
+            WHERE key = old.image_path;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS animals_blobs_update AFTER UPDATE OF image_path ON animals
+        WHEN old.image_path IS NOT new.image_path BEGIN
+            UPDATE blobs SET refcount = refcount - 1, orphaned_at = CASE WHEN refcount <= 1 THEN {now} END
+            WHERE key = old.image_path;
+            UPDATE blobs SET refcount = refcount + 1, orphaned_at = NULL WHERE key = new.image_path;
+        END
+    ''')
+
+
+@migration(10, "registro de alterações de animais para o feed de eventos")
+def _feed_alteracoes(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS animal_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            animal_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+            changed_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_animal_changes_at ON animal_changes (changed_at)")
+
+    # Triggers cobrem cadastro, exclusão de conta, seed, importação e o fim do processamento da foto
+    now = "(julianday('now') - 2440587.5) * 86400.0"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS animals_changes_insert AFTER INSERT ON animals BEGIN
+            INSERT INTO animal_changes (animal_id, op, changed_at) VALUES (new.id, 'insert', {now});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS animals_changes_delete AFTER DELETE ON animals BEGIN
+            INSERT INTO animal_changes (animal_id, op, changed_at) VALUES (old.id, 'delete', {now});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS animals_changes_update
+        AFTER UPDATE OF name, description, image_path, image_variants, image_status, species, sex ON animals BEGIN
+            INSERT INTO animal_changes (animal_id, op, changed_at) VALUES (new.id, 'update', {now});
+        END
+    ''')
+
+
+@migration(11, "índice de animais parecidos (termos TF-IDF e top-k)")
+def _indice_parecidos(cursor):
+    # Frequência de documento de cada termo, mantida junto com animal_terms
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS similar_terms (
+            term TEXT PRIMARY KEY,
+            df INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    # Índice invertido: termo -> animais, com o peso TF-IDF já normalizado de cada um
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS animal_terms (
+            term TEXT NOT NULL,
+            animal_id INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            PRIMARY KEY (term, animal_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_animal_terms_animal ON animal_terms (animal_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS similar_animals (
+            animal_id INTEGER NOT NULL,
+            similar_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (animal_id, similar_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_similar_animals_similar ON similar_animals (similar_id)")
+
+    # Um animal removido sai do índice e das listas dos outros
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS animals_similar_delete AFTER DELETE ON animals BEGIN
+            UPDATE similar_terms SET df = df - 1
+            WHERE term IN (SELECT term FROM animal_terms WHERE animal_id = old.id);
+            DELETE FROM animal_terms WHERE animal_id = old.id;
+            DELETE FROM similar_animals WHERE animal_id = old.id;
+            DELETE FROM similar_animals WHERE similar_id = old.id;
+        END
+    ''')
+
+    # Animais já cadastrados entram no índice agora; os novos, pelo job index_similar
+    import similar
+    similar.rebuild(cursor, similar.settings(), in_transaction=True)
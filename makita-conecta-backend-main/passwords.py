@@ -0,0 +1,167 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+import bcrypt
+from flask import current_app, jsonify
+from database import connect
+from tracing import get_logger, span
+from metrics import PASSWORD_DURATION, PASSWORD_SHED
+
+logger = get_logger(__name__)
+
+# bcrypt só considera os primeiros 72 bytes; versões novas recusam senhas maiores
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusy(Exception):
+    """Todas as vagas do pool de hash estão ocupadas"""
+
+
+def _encode(password):
+    return password.encode("utf-8")[:MAX_PASSWORD_BYTES]
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _checkpw(password, hashed):
+    try:
+        return bcrypt.checkpw(password, hashed.encode("utf-8"))
+    except ValueError:
+        # Hash malformado (ex.: o placeholder do usuário do seed) nunca confere
+        return False
+
+
+def hash_rounds(hashed):
+    """Custo gravado em um hash bcrypt ($2b$12$...), ou None se não for reconhecido"""
+    parts = hashed.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """Executa bcrypt em processos separados, com um limite de operações em andamento.
+
+    Quando as vagas acabam, espera até `queue_timeout` segundos e então levanta
+    HasherBusy em vez de deixar a fila (e a latência) crescer sem limite.
+    Com `workers=0` o hash roda na própria thread, sem pool.
+    """
+
+    def __init__(self, rounds, workers, max_pending, queue_timeout):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+
+    def _ensure_pool(self):
+        # Um pool herdado via fork (ex.: workers do gunicorn) não funciona no filho
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self.workers:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=context)
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+            self._pid = os.getpid()
+
+    def submit(self, func, *args, wait=True):
+        """Agenda `func(*args)` e retorna um Future; levanta HasherBusy sem vaga livre"""
+        self._ensure_pool()
+        slots = self._slots
+        if not slots.acquire(timeout=self.queue_timeout if wait else 0):
+            raise HasherBusy()
+
+        if self._executor is None:
+            future = Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                slots.release()
+            return future
+
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def hash(self, password):
+        with span("bcrypt"), PASSWORD_DURATION.time(operation="hash"):
+            return self.submit(_hashpw, _encode(password), self.rounds).result()
+
+    def verify(self, password, hashed):
+        with span("bcrypt"), PASSWORD_DURATION.time(operation="verify"):
+            return self.submit(_checkpw, _encode(password), hashed).result()
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def rehash_later(self, settings, user_id, old_hash, password):
+        """Regrava o hash do usuário com o custo atual, sem segurar a resposta do login.
+
+        Só usa vaga livre no pool; se não houver, tenta de novo no próximo login.
+        """
+        try:
+            future = self.submit(_hashpw, _encode(password), self.rounds, wait=False)
+        except HasherBusy:
+            return
+
+        def store(done):
+            if done.exception() is not None:
+                logger.warning("falha ao recalcular hash de senha", extra={"user": user_id, "error": repr(done.exception())})
+                return
+            conn = connect(settings)
+            try:
+                with conn:
+                    # Não sobrescreve uma senha trocada enquanto o hash era calculado
+                    conn.execute(
+                        "UPDATE users SET password = ? WHERE id = ? AND password = ?",
+                        (done.result(), user_id, old_hash),
+                    )
+            finally:
+                conn.close()
+
+        future.add_done_callback(store)
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._pid = None
+        self._executor = None
+
+
+def init_app(app):
+    config = app.config
+    workers = config["PASSWORD_WORKERS"]
+    app.extensions["passwords"] = PasswordHasher(
+        rounds=config["BCRYPT_LOG_ROUNDS"],
+        workers=workers,
+        max_pending=config["PASSWORD_MAX_PENDING"] or max(workers, 1) * 4,
+        queue_timeout=config["PASSWORD_QUEUE_TIMEOUT"],
+    )
+
+    @app.errorhandler(HasherBusy)
+    def hasher_busy(e):
+        PASSWORD_SHED.inc()
+        logger.warning("pool de hash de senha lotado; requisicao recusada")
+        response = jsonify({"message": "Servidor ocupado, tente novamente em instantes"})
+        response.headers["Retry-After"] = str(config["PASSWORD_RETRY_AFTER"])
+        return response, 503
+
+
+def get_hasher():
+    return current_app.extensions["passwords"]
@@ -0,0 +1,163 @@
+import os
+import math
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from flask import current_app, jsonify, request
+from flask_jwt_extended import decode_token
+from metrics import RATELIMIT_REJECTED
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+
+class MemoryBuckets:
+    """Baldes de tokens em memória, só deste processo; os menos usados são descartados"""
+
+    def __init__(self, max_entries=100_000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, capacity, rate, now=None):
+        """Tenta retirar `cost` tokens; retorna (permitido, tokens restantes)"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SqliteBuckets:
+    """Baldes de tokens num arquivo SQLite, compartilhados entre os processos da máquina.
+
+    Cada tentativa é um único UPSERT atômico: recarrega, decide e desconta no mesmo comando.
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._calls = 0
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def _conn(self):
+        # Uma conexão por thread; a herdada de outro processo (fork) não é reaproveitada
+        if getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def take(self, key, cost, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        conn = self._conn()
+        # No UPDATE todas as expressões leem os valores antigos da linha
+        tokens, allowed = conn.execute("""
+            INSERT INTO buckets (key, tokens, updated, allowed)
+            VALUES (:key, CASE WHEN :capacity >= :cost THEN :capacity - :cost ELSE :capacity END, :now, :capacity >= :cost)
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = MIN(:capacity, tokens + (:now - updated) * :rate)
+                    - CASE WHEN MIN(:capacity, tokens + (:now - updated) * :rate) >= :cost THEN :cost ELSE 0 END,
+                allowed = MIN(:capacity, tokens + (:now - updated) * :rate) >= :cost,
+                updated = :now
+            RETURNING tokens, allowed
+        """, {"key": key, "cost": cost, "capacity": capacity, "rate": rate, "now": now}).fetchone()
+
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            # Balde parado há tempo suficiente para encher é igual a balde novo
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (now - capacity / rate,))
+        return bool(allowed), tokens
+
+
+def create_backend(url, max_entries):
+    """memory:// limita por processo; sqlite:///caminho compartilha entre processos"""
+    if url.startswith("memory://"):
+        return MemoryBuckets(max_entries)
+    if url.startswith("sqlite:///"):
+        return SqliteBuckets(url[len("sqlite:///"):])
+    raise ValueError(f"RATELIMIT_STORAGE não suportada: {url}")
+
+
+def retry_after(tokens, cost, rate):
+    """Segundos inteiros até o balde ter tokens suficientes"""
+    return max(1, math.ceil((cost - tokens) / rate))
+
+
+def _current_user_id():
+    """Id do usuário de um token válido, se houver; token inválido fica para a própria rota.
+
+    Só decodifica o token e lê a claim `uid`: o user_lookup_loader (cache ou banco) não
+    roda, então uma requisição recusada com 429 não chega a buscar o usuário.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme != "Bearer" or not token:
+        return None
+    try:
+        return decode_token(token).get("uid")
+    except Exception:
+        return None
+
+
+def _admit():
+    config = current_app.config
+    cost = config["RATELIMIT_COSTS"].get(request.endpoint)
+    if not cost:
+        return None
+
+    backend = current_app.extensions["ratelimit"]
+    capacity = config["RATELIMIT_CAPACITY"]
+    # Um custo acima da capacidade nunca caberia no balde: a rota responderia 429 para sempre
+    cost = min(cost, capacity)
+    rate = config["RATELIMIT_REFILL_RATE"]
+    keys = [("ip", f"ip:{request.remote_addr}")]
+    user_id = _current_user_id()
+    if user_id is not None:
+        keys.append(("user", f"user:{user_id}"))
+
+    for scope, key in keys:
+        allowed, tokens = backend.take(key, cost, capacity, rate)
+        if not allowed:
+            RATELIMIT_REJECTED.inc(endpoint=request.endpoint, scope=scope)
+            logger.warning("requisicao limitada", extra={"endpoint": request.endpoint, "key": key})
+            response = jsonify({"message": "Muitas requisicoes, tente novamente em instantes"})
+            response.headers["Retry-After"] = str(retry_after(tokens, cost, rate))
+            return response, 429
+    return None
+
+
+def init_app(app):
+    """Aplica o limite por IP e por usuário às rotas listadas em RATELIMIT_COSTS.
+
+    Roda antes da view, então uma requisição recusada não chega a ler o corpo
+    nem a gastar bcrypt ou disco.
+    """
+    if not app.config["RATELIMIT_ENABLED"]:
+        return
+    capacity = app.config["RATELIMIT_CAPACITY"]
+    for endpoint, cost in app.config["RATELIMIT_COSTS"].items():
+        if cost > capacity:
+            logger.warning("custo maior que RATELIMIT_CAPACITY; limitado a capacidade", extra={
+                "endpoint": endpoint, "cost": cost, "capacity": capacity,
+            })
+    app.extensions["ratelimit"] = create_backend(app.config["RATELIMIT_STORAGE"], app.config["RATELIMIT_MAX_KEYS"])
+    app.before_request(_admit)
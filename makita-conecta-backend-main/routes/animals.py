@@ -1,19 +1,38 @@
 import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
+import re
+import json
+import base64
+import logging
+import mimetypes
+import sqlite3
+import zipfile
+from flask import Blueprint, Response, g, request, jsonify, current_app, send_file, abort, redirect, stream_with_context
+from flask_jwt_extended import jwt_required, current_user
 from database import get_db
+from cache import cached_json
+from identity import user_must_exist
+from images import UploadError, save_upload, file_digest
+from storage import CONTENT_KEY, get_storage
+from changes import get_feed
+import jobs
+import bulk
+from lookups import normalize_species, normalize_sex
+from tracing import get_logger, span, set_rows, timed
+from jsonstream import NDJSON_MIMETYPE, stream_page
 
 animals_bp = Blueprint('animals', __name__)
+logger = get_logger(__name__)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ANIMAL_COLUMNS = ("id", "name", "description", "image_path", "image_variants", "image_status", "species", "sex", "owner_id", "created_at")
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+UUID_PREFIX = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_")
+
+# Campos calculados aceitos em fields= e a coluna de que cada um depende
+COMPUTED_FIELDS = {"image_url": "image_path", "image_urls": "image_variants"}
 
 @animals_bp.route("/animals", methods=["POST"])
 @jwt_required()
+@user_must_exist
 def create_animal():
     if 'image' not in request.files:
         return jsonify({"message": "Nenhuma imagem enviada"}), 400
@@ -21,136 +40,524 @@ def create_animal():
     file = request.files['image']
     name = request.form.get('name')
     description = request.form.get('description')
+    species = normalize_species(request.form.get('species'))
+    sex = normalize_sex(request.form.get('sex'))
+    
+    if request.form.get('species') and species is None:
+        return jsonify({"message": "Especie invalida"}), 400
+    if request.form.get('sex') and sex is None:
+        return jsonify({"message": "Sexo invalido"}), 400
 
     if file.filename == '':
         return jsonify({"message": "Nenhum arquivo selecionado"}), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        
-        save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(save_path)
+    conn = get_db()
+    try:
+        image_key = save_upload(file, get_storage(), conn, current_app.config['IMAGE_MAX_BYTES'])
+    except UploadError as e:
+        return jsonify({"message": str(e)}), 400
+    
+    user_id = current_user["id"]
+    cursor = conn.cursor()
 
-        current_user_email = get_jwt_identity()
-        conn = get_db()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id FROM users WHERE email = ?", (current_user_email,))
-        user_id = cursor.fetchone()['id']
+    # As variantes são geradas por um worker (flask jobs work), fora da requisição
+    cursor.execute("""
+        INSERT INTO animals (name, description, image_path, image_status, species, sex, owner_id)
+        VALUES (?, ?, ?, 'pending', ?, ?, ?)
+    """, (name, description, image_key, species, sex, user_id))
+    animal_id = cursor.lastrowid
+    jobs.enqueue(cursor, "process_image", {"animal_id": animal_id})
+    jobs.enqueue(cursor, "index_similar", {"animal_id": animal_id})
+    conn.commit()
 
-        cursor.execute("""
-            INSERT INTO animals (name, description, image_path, owner_id)
-            VALUES (?, ?, ?, ?)
-        """, (name, description, unique_filename, user_id))
-        conn.commit()
+    return jsonify({
+        "message": "Animal cadastrado com sucesso!",
+        "id": animal_id,
+        "image": image_key,
+        "image_status": "pending",
+    }), 201
+
+def image_url_for(image_path):
+    """Monta a URL pública de uma imagem armazenada em uploads"""
+    if not image_path:
+        return None
+    if image_path.startswith("http"):
+        return image_path
+    # Montada uma vez por requisição, não a cada imagem de cada linha
+    if "uploads_base_url" not in g:
+        g.uploads_base_url = request.host_url.rstrip('/') + "/api/uploads/"
+    return g.uploads_base_url + image_path
 
-        return jsonify({"message": "Animal cadastrado com sucesso!", "image": unique_filename}), 201
+def serialize_animal(row, exclude=()):
+    """Converte uma linha de animals no JSON devolvido pela API"""
+    animal = dict(row)
+    for key in exclude:
+        animal.pop(key, None)
+    
+    variants = None
+    if 'image_variants' in animal:
+        stored = animal.pop('image_variants')
+        variants = json.loads(stored) if stored else None
+        animal['image_urls'] = (
+            {variant: image_url_for(path) for variant, path in variants.items()} if variants else None
+        )
     
-    return jsonify({"message": "Tipo de arquivo não permitido"}), 400
+    if 'image_path' in animal:
+        if variants and 'full' in variants:
+            animal['image_url'] = image_url_for(variants['full'])
+        else:
+            animal['image_url'] = image_url_for(animal['image_path'])
+    return animal
+
+def encode_cursor(*values):
+    """Gera o cursor opaco usado na paginação por keyset"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Lê um cursor gerado por encode_cursor, ou None se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return values if isinstance(values, list) else None
+
+def valid_cursor(values, ranked):
+    """Confere se o cursor tem o formato esperado pela ordenação em uso"""
+    if not values:
+        return False
+    if ranked:
+        return len(values) == 2 and isinstance(values[0], (int, float)) and isinstance(values[1], int)
+    return len(values) == 1 and isinstance(values[0], int)
+
+def build_match_query(text):
+    """Converte o texto da busca em uma expressão MATCH do FTS5 com prefixo"""
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+def parse_fields(raw):
+    """Valida o parâmetro fields= e retorna as colunas a selecionar"""
+    if not raw:
+        return list(ANIMAL_COLUMNS)
+    
+    requested = [f.strip() for f in raw.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in ANIMAL_COLUMNS and f not in COMPUTED_FIELDS]
+    if unknown:
+        return None
+    
+    columns = ["id"]
+    for field in requested:
+        column = COMPUTED_FIELDS.get(field, field)
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+def parse_limit(raw):
+    """Normaliza o tamanho da página dentro dos limites configurados"""
+    default = current_app.config["ANIMALS_PAGE_SIZE"]
+    maximum = current_app.config["ANIMALS_MAX_PAGE_SIZE"]
+    try:
+        limit = int(raw) if raw else default
+    except ValueError:
+        return None
+    return max(1, min(limit, maximum))
+
+def wants_ndjson():
+    """NDJSON quando pedido por format=ndjson ou pelo cabeçalho Accept"""
+    if request.args.get("format"):
+        return request.args["format"] == "ndjson"
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def list_cache_key():
+    """Parâmetros da listagem normalizados, para que buscas equivalentes dividam a entrada"""
+    args = request.args
+    fields = ",".join(sorted(f.strip() for f in args.get("fields", "").split(",") if f.strip()))
+    return "|".join([
+        " ".join(args.get("query", "").lower().split()),
+        normalize_species(args.get("species")) or args.get("species", "").lower(),
+        normalize_sex(args.get("sex")) or args.get("sex", "").lower(),
+        args.get("limit", ""),
+        args.get("after", ""),
+        fields,
+        "ndjson" if wants_ndjson() else "json",
+    ])
 
 @animals_bp.route("/animals", methods=["GET"])
+@cached_json("animals", list_cache_key)
 def list_animals():
     query = request.args.get("query", "").strip()
     species = request.args.get("species", "")
     sex = request.args.get("sex", "")
     
-    print("\n" + "="*60)
-    print("BACKEND - BUSCA RECEBIDA:")
-    print(f" Query: '{query}'")
-    print(f" Species: '{species}'")
-    print(f" Sex: '{sex}'")
-    print(f" URL completa: {request.url}")
-    print("="*60)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("busca recebida", extra={"query": query, "species": species, "sex": sex})
     
-    conn = get_db()
-    cursor = conn.cursor()
+    limit = parse_limit(request.args.get("limit"))
+    if limit is None:
+        return jsonify({"message": "Parametro limit invalido"}), 400
     
-    cursor.execute("PRAGMA table_info(animals)")
-    columns = [col['name'] for col in cursor.fetchall()]
-    print(f"COLUNAS DA TABELA: {columns}")
+    columns = parse_fields(request.args.get("fields"))
+    if columns is None:
+        return jsonify({"message": "Parametro fields invalido"}), 400
     
-    cursor.execute("SELECT id, name, species, sex FROM animals LIMIT 10")
-    sample = cursor.fetchall()
-    print(f"AMOSTRA DE DADOS (10 primeiros):")
-    for animal in sample:
-        print(f"   - {animal['name']} (ID: {animal['id']}): species='{animal['species']}', sex='{animal['sex']}'")
+    species_code = None
+    if species and species.lower() not in ["", "todos", "all"]:
+        species_code = normalize_species(species)
+        if species_code is None:
+            return jsonify({"message": "Especie invalida"}), 400
+    
+    sex_code = None
+    if sex and sex.lower() not in ["", "todos", "all"]:
+        sex_code = normalize_sex(sex)
+        if sex_code is None:
+            return jsonify({"message": "Sexo invalido"}), 400
+    
+    match = build_match_query(query)
+    
+    after = None
+    if request.args.get("after"):
+        after = decode_cursor(request.args["after"])
+        if not valid_cursor(after, ranked=match is not None):
+            return jsonify({"message": "Cursor invalido"}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
     
-    sql = "SELECT * FROM animals WHERE 1=1"
+    select = ", ".join(f"a.{column}" for column in columns)
     params = []
     
-    if query:
-        sql += " AND (LOWER(name) LIKE ? OR LOWER(description) LIKE ?)"
-        term = f"%{query.lower()}%"
-        params.append(term)
-        params.append(term)
+    if match:
+        sql = f"""
+            SELECT {select}, animals_fts.rank AS rank
+            FROM animals_fts JOIN animals a ON a.id = animals_fts.rowid
+            WHERE animals_fts MATCH ?
+        """
+        params.append(match)
+    else:
+        sql = f"SELECT {select} FROM animals a WHERE 1=1"
     
-    if species and species.lower() not in ["", "todos", "all"]:
-        sql += " AND LOWER(species) = ?"
-        params.append(species.lower())
+    if species_code:
+        sql += " AND a.species = ?"
+        params.append(species_code)
     
-    if sex and sex.lower() not in ["", "todos", "all"]:
-        sql += " AND LOWER(sex) = ?"
-        params.append(sex.lower())
+    if sex_code:
+        sql += " AND a.sex = ?"
+        params.append(sex_code)
     
-    sql += " ORDER BY id DESC"
+    if match:
+        if after:
+            sql += " AND (animals_fts.rank > ? OR (animals_fts.rank = ? AND a.id < ?))"
+            params.extend([after[0], after[0], after[1]])
+        sql += " ORDER BY animals_fts.rank, a.id DESC"
+    else:
+        if after:
+            sql += " AND a.id < ?"
+            params.append(after[0])
+        sql += " ORDER BY a.id DESC"
     
-    print(f"\nSQL GERADO:")
-    print(f"   {sql}")
-    print(f"   Parâmetros: {params}")
+    # Busca um registro a mais para saber se existe próxima página
+    sql += " LIMIT ?"
+    params.append(limit + 1)
     
     try:
-        cursor.execute(sql, params)
-        animals = cursor.fetchall()
-        
-        animals_list = [dict(row) for row in animals]
-        
-        print(f"\nRESULTADOS ENCONTRADOS: {len(animals_list)} animais")
-        for animal in animals_list:
-            print(f"   - {animal['name']} ({animal['species']}, {animal['sex']})")
-        
-        for animal in animals_list:
-            if animal.get('image_path'):
-                if animal['image_path'].startswith("http"):
-                    animal['image_url'] = animal['image_path']
-                else:
-                    base_url = request.host_url.rstrip('/')
-                    animal['image_url'] = f"{base_url}/api/uploads/{animal['image_path']}"
-        
-        print("="*60 + "\n")
-        return jsonify(animals_list), 200
-        
+        with span("sql"):
+            cursor.execute(sql, params)
     except Exception as e:
-        print(f"\nERRO NO SQL: {e}")
-        import traceback
-        traceback.print_exc()
-        print("="*60 + "\n")
+        logger.exception("erro ao listar animais", extra={"sql": sql})
         return jsonify({"error": str(e)}), 500
     
+    if match:
+        cursor_for = lambda row: encode_cursor(row['rank'], row['id'])
+    else:
+        cursor_for = lambda row: encode_cursor(row['id'])
+    
+    # As linhas saem do cursor direto para a resposta, uma a uma
+    body = stream_page(
+        cursor,
+        limit,
+        lambda row: serialize_animal(row, exclude=("rank",)),
+        cursor_for,
+        key="animals",
+        ndjson=wants_ndjson(),
+        on_done=set_rows,
+    )
+    return Response(
+        stream_with_context(timed("stream", body)),
+        mimetype=NDJSON_MIMETYPE if wants_ndjson() else "application/json",
+    )
+    
+@animals_bp.route("/animals/changes", methods=["GET"])
+def animal_changes():
+    # since= no primeiro acesso; o navegador reenvia o último id visto em Last-Event-ID
+    since = request.args.get("since") or request.headers.get("Last-Event-ID")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"message": "Parametro since invalido"}), 400
+        if since < 0:
+            return jsonify({"message": "Parametro since invalido"}), 400
+    
+    config = current_app.config
+    # Sem stream_with_context: o stream não segura conexão do pool enquanto espera
+    body = get_feed().stream(since, config["CHANGES_HEARTBEAT"], config["CHANGES_MAX_STREAM_SECONDS"])
+    return Response(body, mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@animals_bp.route("/animals/facets", methods=["GET"])
+@cached_json("animals", lambda: "")
+def animal_facets():
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # GROUP BY percorre apenas o índice (species, sex, id), sem tocar na tabela
+    with span("sql"):
+        cursor.execute("""
+            SELECT species, sex, COUNT(*) AS total
+            FROM animals
+            GROUP BY species, sex
+        """)
+        rows = cursor.fetchall()
+    
+    species_counts = {}
+    sex_counts = {}
+    combinations = []
+    for row in rows:
+        species_key = row['species'] or "indefinido"
+        sex_key = row['sex'] or "indefinido"
+        species_counts[species_key] = species_counts.get(species_key, 0) + row['total']
+        sex_counts[sex_key] = sex_counts.get(sex_key, 0) + row['total']
+        combinations.append({"species": row['species'], "sex": row['sex'], "total": row['total']})
+    
+    set_rows(len(rows))
+    return jsonify({
+        "total": sum(species_counts.values()),
+        "species": species_counts,
+        "sex": sex_counts,
+        "combinations": combinations,
+    }), 200
+
+@animals_bp.route("/animals/import", methods=["POST"])
+@jwt_required()
+@user_must_exist
+def import_animals():
+    # Lotes de abrigos passam bem dos 16 MB de um cadastro comum
+    request.max_content_length = current_app.config['IMPORT_MAX_BYTES']
+    
+    if 'file' not in request.files:
+        return jsonify({"message": "Envie o arquivo NDJSON ou CSV no campo file"}), 400
+    
+    file = request.files['file']
+    try:
+        fmt = bulk.detect_format(file.filename, request.form.get('format'))
+        images = zipfile.ZipFile(request.files['images'].stream) if 'images' in request.files else None
+    except (ValueError, zipfile.BadZipFile) as e:
+        return jsonify({"message": str(e)}), 400
+    
+    importer = bulk.Importer(
+        get_db(),
+        current_user["id"],
+        get_storage(),
+        images=images,
+        batch_size=current_app.config['IMPORT_BATCH_SIZE'],
+        max_errors=current_app.config['IMPORT_MAX_ERRORS'],
+        image_max_bytes=current_app.config['IMAGE_MAX_BYTES'],
+        job_max_attempts=current_app.config['JOBS_MAX_ATTEMPTS'],
+    )
+    with span("import"):
+        summary = importer.run(bulk.iter_records(file.stream, fmt))
+    
+    logger.info("importacao concluida", extra={"user": current_user["id"], "imported": summary["imported"], "failed": summary["failed"]})
+    return jsonify(summary), 200 if summary["imported"] or not summary["failed"] else 400
+
+@animals_bp.route("/animals/export", methods=["GET"])
+def export_animals():
+    try:
+        fmt = bulk.detect_format(None, request.args.get('format', 'ndjson'))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    
+    chunks = bulk.iter_export(
+        get_db(),
+        fmt,
+        image_url=image_url_for,
+        species=normalize_species(request.args.get('species')),
+        sex=normalize_sex(request.args.get('sex')),
+    )
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=animals.{fmt}"},
+    )
+
 @animals_bp.route("/animals/<int:animal_id>", methods=["GET"])
+@cached_json("animals", lambda: "")
 def get_animal(animal_id):
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM animals WHERE id = ?", (animal_id,))
+    cursor.execute(f"SELECT {', '.join(ANIMAL_COLUMNS)} FROM animals WHERE id = ?", (animal_id,))
     animal = cursor.fetchone()
     
     if not animal:
         return jsonify({"message": "Animal nao encontrado"}), 404
     
-    animal_dict = dict(animal)
+    return jsonify(serialize_animal(animal)), 200
+
+def similar_cache_key():
+    fields = ",".join(sorted(f.strip() for f in request.args.get("fields", "").split(",") if f.strip()))
+    return "|".join([request.args.get("limit", ""), fields])
+
+@animals_bp.route("/animals/<int:animal_id>/similar", methods=["GET"])
+@cached_json("animals", similar_cache_key)
+def get_similar_animals(animal_id):
+    """Os animais mais parecidos, lidos do índice pré-calculado (similar.py)"""
+    try:
+        limit = int(request.args.get("limit") or 10)
+    except ValueError:
+        return jsonify({"message": "Parametro limit invalido"}), 400
+    limit = max(1, min(limit, current_app.config["SIMILAR_TOP_K"]))
     
-    if animal_dict['image_path']:
-        if animal_dict['image_path'].startswith("http"):
-            animal_dict['image_url'] = animal_dict['image_path']
-        else:
-            base_url = request.host_url.rstrip('/')
-            animal_dict['image_url'] = f"{base_url}/api/uploads/{animal_dict['image_path']}"
-    else:
-        animal_dict['image_url'] = None
+    columns = parse_fields(request.args.get("fields"))
+    if columns is None:
+        return jsonify({"message": "Parametro fields invalido"}), 400
     
-    return jsonify(animal_dict), 200
+    conn = get_db()
+    if conn.execute("SELECT 1 FROM animals WHERE id = ?", (animal_id,)).fetchone() is None:
+        return jsonify({"message": "Animal nao encontrado"}), 404
+    
+    with span("sql"):
+        rows = conn.execute(f"""
+            SELECT {', '.join('a.' + c for c in columns)}, s.score
+            FROM similar_animals s JOIN animals a ON a.id = s.similar_id
+            WHERE s.animal_id = ?
+            ORDER BY s.score DESC, s.similar_id
+            LIMIT ?
+        """, (animal_id, limit)).fetchall()
+    
+    set_rows(len(rows))
+    animals = []
+    for row in rows:
+        animal = serialize_animal(row, exclude=("score",))
+        animal["score"] = round(row["score"], 4)
+        animals.append(animal)
+    return jsonify({"animal_id": animal_id, "animals": animals}), 200
+
+def parse_ids(values):
+    """Ids inteiros positivos na ordem pedida, sem repetições; None se algum for inválido"""
+    ids = {}
+    for value in values:
+        if isinstance(value, bool):
+            return None
+        try:
+            animal_id = int(value)
+        except (TypeError, ValueError):
+            return None
+        if animal_id < 1 or (isinstance(value, float) and value != animal_id):
+            return None
+        ids.setdefault(animal_id, None)
+    return list(ids)
+
+def batch_query_ids():
+    """ids= aceita tanto 1,2,3 quanto ids=1&ids=2"""
+    return [part for value in request.args.getlist("ids") for part in value.split(",") if part.strip()]
+
+def batch_cache_key():
+    ids = parse_ids(batch_query_ids()) or []
+    fields = ",".join(sorted(f.strip() for f in request.args.get("fields", "").split(",") if f.strip()))
+    return "|".join([",".join(map(str, ids)), fields])
+
+def fetch_batch(raw_ids, raw_fields):
+    """Busca vários animais com um IN (...) por bloco, na ordem pedida, listando os ausentes"""
+    ids = parse_ids(raw_ids)
+    if not ids:
+        return jsonify({"message": "Informe ids inteiros positivos"}), 400
+    if len(ids) > current_app.config["ANIMALS_BATCH_MAX_IDS"]:
+        return jsonify({"message": f"No maximo {current_app.config['ANIMALS_BATCH_MAX_IDS']} ids por requisicao"}), 400
+    
+    columns = parse_fields(raw_fields)
+    if columns is None:
+        return jsonify({"message": "Parametro fields invalido"}), 400
+    
+    conn = get_db()
+    # Respeita o limite de parâmetros do SQLite em listas longas
+    chunk_size = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    found = {}
+    with span("sql"):
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM animals WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for row in rows:
+                found[row["id"]] = serialize_animal(row)
+    
+    set_rows(len(found))
+    return jsonify({
+        "animals": [found[animal_id] for animal_id in ids if animal_id in found],
+        "missing": [animal_id for animal_id in ids if animal_id not in found],
+    }), 200
+
+@animals_bp.route("/animals/batch", methods=["GET"])
+@cached_json("animals", batch_cache_key)
+def get_animals_batch():
+    return fetch_batch(batch_query_ids(), request.args.get("fields"))
 
-@animals_bp.route("/uploads/<filename>")
+@animals_bp.route("/animals/batch", methods=["POST"])
+def post_animals_batch():
+    # Para listas longas demais para a URL
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get("ids"), list):
+        return jsonify({"message": "Envie um JSON com a lista ids"}), 400
+    fields = payload.get("fields")
+    if isinstance(fields, list):
+        fields = ",".join(map(str, fields))
+    elif fields is not None and not isinstance(fields, str):
+        return jsonify({"message": "Parametro fields invalido"}), 400
+    return fetch_batch(payload["ids"], fields)
+
+@animals_bp.route("/uploads/<path:filename>")
 def get_image(filename):
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
\ No newline at end of file
+    storage = get_storage()
+    url = storage.url(filename)
+    if url is not None:
+        # Storage remoto: o cliente baixa direto dele
+        return redirect(url)
+    
+    # Arquivos ocultos incluem os temporários de upload em andamento (.tmp/)
+    path = storage.path(filename) if not filename.startswith(".") else None
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    
+    # Chaves por conteúdo já trazem o hash no nome; nas antigas ele é calculado do arquivo
+    content_key = CONTENT_KEY.match(filename)
+    etag = os.path.splitext(os.path.basename(filename))[0] if content_key else file_digest(path)
+    
+    if current_app.config['UPLOADS_SENDFILE_MODE'] == "x-accel":
+        # O nginx lê o arquivo de uma location interna; o Python só responde os cabeçalhos
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.set_etag(etag)
+        response.make_conditional(request)
+        if response.status_code != 304:
+            response.headers['X-Accel-Redirect'] = current_app.config['UPLOADS_ACCEL_PREFIX'] + filename
+    else:
+        # send_file trata If-None-Match (304), Range (206) e X-Sendfile quando USE_X_SENDFILE
+        response = send_file(path, etag=etag, conditional=True)
+    
+    # Chaves por conteúdo e nomes com prefixo UUID nunca são reaproveitados para outro conteúdo
+    if content_key or UUID_PREFIX.match(filename):
+        response.cache_control.public = True
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = current_app.config['UPLOADS_MAX_AGE']
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+    return response
\ No newline at end of file
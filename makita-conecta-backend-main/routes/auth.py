@@ -1,47 +1,21 @@
 from datetime import timedelta
-from flask import Blueprint, request, jsonify
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, current_user
 from database import get_db
 import sqlite3
 import re
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from config import Config
+import mailer
+import identity
+from passwords import get_hasher
+from tracing import get_logger
 
 auth_bp = Blueprint('auth', __name__)
-bcrypt = Bcrypt() 
+logger = get_logger(__name__)
 
 def is_valid_email(email):
     regex = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(regex, email) is not None
 
-def send_email_brevo(to_email, subject, html_content):
-    try:
-        if not Config.MAIL_SERVER or not Config.MAIL_PORT or not Config.MAIL_USERNAME or not Config.MAIL_PASSWORD:
-            print("Configuracoes de email incompletas.")
-            return False
-
-        msg = MIMEMultipart()
-        sender = Config.MAIL_DEFAULT_SENDER if hasattr(Config, 'MAIL_DEFAULT_SENDER') else Config.MAIL_SENDER
-        msg['From'] = f"MakitaConecta <{sender}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-
-        msg.attach(MIMEText(html_content, 'html'))
-
-        server = smtplib.SMTP(Config.MAIL_SERVER, Config.MAIL_PORT)
-        server.starttls()
-        server.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
-        
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Erro ao enviar email: {e}")
-        return False
-
 @auth_bp.route("/register", methods=["POST"])
 def register_user():
     data = request.get_json()
@@ -56,7 +30,7 @@ def register_user():
     if not is_valid_email(email):
         return jsonify({"message": "Email invalido"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = get_hasher().hash(password)
 
     try:
         conn = get_db()
@@ -81,31 +55,23 @@ def login_user():
     cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
     user = cursor.fetchone()
 
-    if not user or not bcrypt.check_password_hash(user["password"], password):
+    hasher = get_hasher()
+    if not user or not password or not hasher.verify(password, user["password"]):
         return jsonify({"message": "Credenciais invalidas"}), 401 
 
-    access_token = create_access_token(identity=email)
+    if hasher.needs_rehash(user["password"]):
+        hasher.rehash_later(current_app.config, user["id"], user["password"], password)
+
+    access_token = identity.token_for(user)
     return jsonify(access_token=access_token), 200
 
 @auth_bp.route("/profile", methods=["GET"])
 @jwt_required()
 def get_profile():
-    current_user_email = get_jwt_identity()
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    conn.row_factory = sqlite3.Row 
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT name, email FROM users WHERE email = ?", (current_user_email,))
-    user = cursor.fetchone()
-
-    if not user:
-        return jsonify({"message": "Usuario nao encontrado"}), 404
-    
     return jsonify({
-        "name": user["name"],
-        "email": user["email"]
+        "id": current_user["id"],
+        "name": current_user["name"],
+        "email": current_user["email"]
     }), 200
 
 @auth_bp.route("/forgot-password", methods=["POST"])
@@ -115,18 +81,18 @@ def forgot_password():
     
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT id, name FROM users WHERE email = ?", (email,))
+    cursor.execute("SELECT id, name, email FROM users WHERE email = ?", (email,))
     user = cursor.fetchone()
     
     if not user:
         return jsonify({"message": "Se o email existir, enviaremos um link de recuperacao"}), 200
         
-    reset_token = create_access_token(identity=email, expires_delta=timedelta(hours=1))
+    reset_token = identity.token_for(user, expires_delta=timedelta(hours=1))
     
     reset_link = f"http://localhost:5173/reset-password?token={reset_token}"
     
-    if not all([Config.MAIL_SERVER, Config.MAIL_PORT, Config.MAIL_USERNAME, Config.MAIL_PASSWORD]):
-        print(f"Modo desenvolvimento: Link de recuperacao para {email}: {reset_link}")
+    if not mailer.is_configured(current_app.config):
+        logger.info("Modo desenvolvimento: link de recuperacao gerado", extra={"email": email, "reset_link": reset_link})
         return jsonify({"message": "Link de recuperacao gerado (modo desenvolvimento)", "reset_link": reset_link}), 200
     
     email_html = f"""
@@ -137,36 +103,36 @@ def forgot_password():
     <p><small>Se voce nao solicitou isso, apenas ignore este e-mail.</small></p>
     """
     
-    sucesso = send_email_brevo(email, "Redefinicao de Senha - MakitaConecta", email_html)
+    # O envio acontece fora da requisição; aqui só gravamos na outbox
+    mailer.enqueue_email(cursor, email, "Redefinicao de Senha - MakitaConecta", email_html)
+    conn.commit()
+    mailer.notify_sender(current_app._get_current_object())
 
-    if sucesso:
-        return jsonify({"message": "Link de recuperacao enviado para seu e-mail!"}), 200
-    else:
-        return jsonify({"message": "Erro ao enviar e-mail. Tente novamente mais tarde."}), 500
+    return jsonify({"message": "Link de recuperacao enviado para seu e-mail!"}), 202
 
 @auth_bp.route("/reset-password", methods=["POST"])
 @jwt_required()
+@identity.user_must_exist
 def reset_password():
-    email = get_jwt_identity()
     data = request.get_json()
     new_password = data.get("newPassword")
     
     if not new_password:
         return jsonify({"message": "Nova senha e obrigatoria"}), 400
         
-    hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    hashed_password = get_hasher().hash(new_password)
     
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("UPDATE users SET password = ? WHERE email = ?", (hashed_password, email))
+    cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, current_user["id"]))
     conn.commit()
     
     return jsonify({"message": "Senha alterada com sucesso!"}), 200
 
 @auth_bp.route("/profile", methods=["PUT"])
 @jwt_required()
+@identity.user_must_exist
 def update_profile():
-    email = get_jwt_identity()
     data = request.get_json()
     new_name = data.get("name")
     
@@ -175,44 +141,39 @@ def update_profile():
         
     conn = get_db()
     cursor = conn.cursor()
-    cursor.execute("UPDATE users SET name = ? WHERE email = ?", (new_name, email))
+    cursor.execute("UPDATE users SET name = ? WHERE id = ?", (new_name, current_user["id"]))
     conn.commit()
+    identity.forget(current_user["id"])
     
     return jsonify({"message": "Perfil atualizado!", "name": new_name}), 200
 
 @auth_bp.route("/profile", methods=["DELETE"])
 @jwt_required()
 def delete_profile():
-    email = get_jwt_identity()
+    email = current_user["email"]
+    user_id = current_user["id"]
     
     conn = get_db()
     cursor = conn.cursor()
     
-    print(f"Tentando deletar conta do usuario: {email}")
+    logger.info("Tentando deletar conta do usuario", extra={"email": email})
     
     try:
-        cursor.execute("SELECT id FROM users WHERE email = ?", (email,))
-        user = cursor.fetchone()
-        
-        if not user:
-            return jsonify({"message": "Usuario nao encontrado"}), 404
-            
-        user_id = user['id']
-        
         cursor.execute("DELETE FROM animals WHERE owner_id = ?", (user_id,))
-        print(f"Animais deletados: {cursor.rowcount}")
+        logger.info("Animais deletados", extra={"email": email, "count": cursor.rowcount})
         
-        cursor.execute("DELETE FROM users WHERE email = ?", (email,))
+        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
         
         if cursor.rowcount == 0:
             return jsonify({"message": "Usuario nao encontrado"}), 404
             
         conn.commit()
+        identity.forget(user_id)
         
-        print(f"Conta deletada com sucesso para: {email}")
+        logger.info("Conta deletada com sucesso", extra={"email": email})
         return jsonify({"message": "Conta deletada com sucesso."}), 200
         
     except Exception as e:
         conn.rollback()
-        print(f"Erro ao deletar conta: {e}")
+        logger.exception("Erro ao deletar conta", extra={"email": email})
         return jsonify({"message": f"Erro ao deletar conta: {str(e)}"}), 500
\ No newline at end of file
@@ -1,6 +1,6 @@
-import sqlite3
 import os
-from config import Config
+from database import connect, current_settings
+import similar
 
 
 ANIMAIS_PARA_CADASTRAR = [
@@ -8,149 +8,154 @@ ANIMAIS_PARA_CADASTRAR = [
         "name": "Luna",
         "description": "Gato Siamês, 2 anos. Dócil e carinhosa.",
         "image_path": "Luna.jpg",
-        "species": "Gato",
-        "sex": "Fêmea"
+        "species": "gato",
+        "sex": "femea"
     },
     {
         "name": "Max",
         "description": "Cão Labrador, 1 ano. Muito brincalhão.",
         "image_path": "Max.jpg",
-        "species": "Cachorro",
-        "sex": "Macho"
+        "species": "cachorro",
+        "sex": "macho"
     },
     {
         "name": "Bella",
         "description": "Cão Poodle, 3 anos. Adora crianças.",
         "image_path": "Bella.jpg",
-        "species": "Cachorro",
-        "sex": "Fêmea"
+        "species": "cachorro",
+        "sex": "femea"
     },
     {
         "name": "Oliver",
         "description": "Gato Persa, 1 ano. Muito tranquilo.",
         "image_path": "Oliver.jpg",
-        "species": "Gato",
-        "sex": "Macho"
+        "species": "gato",
+        "sex": "macho"
     },
     {
         "name": "Sophie",
         "description": "Cachorro Caramelo, 2 anos. Companheira ideal.",
         "image_path": "Sophie.jpg",
-        "species": "Cachorro",
-        "sex": "Fêmea"
+        "species": "cachorro",
+        "sex": "femea"
     },
     {
         "name": "Luana",
         "description": "Cachorro Golden Retriever, 2 anos. Brincalhão e amoroso.",
         "image_path": "Luana.jpg",
-        "species": "Cachorro",
-        "sex": "Fêmea"
+        "species": "cachorro",
+        "sex": "femea"
     },
     {
         "name": "Simba",
         "description": "Gato Laranja, 3 anos. Curioso e independente.",
         "image_path": "Simba.jpg",
-        "species": "Gato",
-        "sex": "Macho"
+        "species": "gato",
+        "sex": "macho"
     },
     {
         "name": "Thor",
         "description": "Cachorro Pastor Alemão, 5 anos. Protetor e leal.",
         "image_path": "Thor.jpg",
-        "species": "Cachorro",
-        "sex": "Macho"
+        "species": "cachorro",
+        "sex": "macho"
     }
 ]
 
 
+DEFAULT_USER = ("Administrador", "admin@example.com", "$2b$12$DEFAULT_HASH_PLACEHOLDER")
+
+
+def seed_key(animal):
+    """Identificador estável de um animal do seed, usado no upsert"""
+    return f"{animal['species']}:{animal['name'].lower()}"
+
+
 def create_default_user(cursor):
-    """Cria um usuário padrão para vincular os animais"""
-    try:
-        cursor.execute("SELECT id FROM users WHERE email = ?", ("admin@example.com",))
-        user = cursor.fetchone()
-        
-        if user:
-            return user[0]
-        
-        cursor.execute("""
-            INSERT INTO users (name, email, password)
-            VALUES (?, ?, ?)
-        """, ("Administrador", "admin@example.com", "$2b$12$DEFAULT_HASH_PLACEHOLDER"))
-        
-        user_id = cursor.lastrowid
-        print(f"Usuário padrão criado com ID: {user_id}")
-        return user_id
-    except Exception as e:
-        print(f"Erro ao criar usuário padrão: {e}")
-        return 1  
+    """Cria (se preciso) o usuário padrão que recebe os animais do seed"""
+    # Consulta antes: um INSERT ... DO NOTHING que conflita gasta um id do AUTOINCREMENT
+    cursor.execute("SELECT id FROM users WHERE email = ?", (DEFAULT_USER[1],))
+    row = cursor.fetchone()
+    if row is not None:
+        return row[0]
+    cursor.execute("INSERT INTO users (name, email, password) VALUES (?, ?, ?)", DEFAULT_USER)
+    return cursor.lastrowid
+
 
-def run_seed():
-    """Executa o seed de animais no banco de dados"""
-    print("\nIniciando seed de animais...")
+def run_seed(conn=None):
+    """Insere ou atualiza os animais do seed em uma única transação.
     
-    if not os.path.exists(Config.UPLOAD_FOLDER):
-        os.makedirs(Config.UPLOAD_FOLDER)
-        print(f"Pasta uploads criada: {Config.UPLOAD_FOLDER}")
+    Só grava os animais novos ou que mudaram, para rodar de novo sem invalidar o
+    cache nem publicar alterações no feed. Retorna (novos, total de animais no sistema).
+    """
+    os.makedirs(current_settings()["UPLOAD_FOLDER"], exist_ok=True)
     
-    conn = sqlite3.connect(Config.DB_NAME)
-    cursor = conn.cursor()
+    own_connection = conn is None
+    if own_connection:
+        conn = connect()
     
     try:
-        owner_id = create_default_user(cursor)
-        
-        novos_adicionados = 0
-        
-        for animal in ANIMAIS_PARA_CADASTRAR:
-            cursor.execute("SELECT id FROM animals WHERE name = ? AND species = ?", 
-                          (animal["name"], animal["species"]))
-            exists = cursor.fetchone()
+        with conn:
+            cursor = conn.cursor()
+            owner_id = create_default_user(cursor)
             
-            if exists:
-                cursor.execute("""
-                    UPDATE animals 
-                    SET description = ?, image_path = ?, sex = ?
-                    WHERE name = ? AND species = ?
-                """, (
-                    animal["description"],
-                    animal["image_path"],
-                    animal["sex"],
-                    animal["name"],
-                    animal["species"]
-                ))
-                print(f"Animal atualizado: {animal['name']}")
-            else:
-                cursor.execute("""
-                    INSERT INTO animals (name, description, image_path, species, sex, owner_id)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    animal["name"],
-                    animal["description"],
-                    animal["image_path"],
-                    animal["species"],
-                    animal["sex"],
-                    owner_id
-                ))
-                novos_adicionados += 1
-                print(f"Animal adicionado: {animal['name']}")
-        
-        conn.commit()
-        
-        # Conta total de animais
-        cursor.execute("SELECT COUNT(*) FROM animals")
-        total = cursor.fetchone()[0]
-        
-        if novos_adicionados > 0:
-            print(f"Seed concluído: {novos_adicionados} novos animais inseridos")
-        else:
-            print(f"Banco verificado: {total} animais já cadastrados")
-        
-        print(f"Total de animais no sistema: {total}")
+            # Animais cadastrados antes da coluna seed_key passam a ser reconhecidos pelo upsert
+            cursor.executemany("""
+                UPDATE animals SET seed_key = ?
+                WHERE seed_key IS NULL AND owner_id = ? AND name = ? AND species = ?
+            """, [(seed_key(a), owner_id, a["name"], a["species"]) for a in ANIMAIS_PARA_CADASTRAR])
+            
+            cursor.execute("SELECT COUNT(*) FROM animals")
+            before = cursor.fetchone()[0]
+            
+            # Retrato do que já existe, para saber depois quais linhas o upsert mudou
+            cursor.execute("""
+                SELECT seed_key, description, image_path, sex FROM animals WHERE seed_key IS NOT NULL
+            """)
+            existing = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+            
+            # O WHERE do DO UPDATE deixa intactas as linhas iguais ao seed: sem gravação,
+            # os triggers não tocam cache_generations nem animal_changes
+            cursor.executemany("""
+                INSERT INTO animals (name, description, image_path, species, sex, owner_id, seed_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (seed_key) WHERE seed_key IS NOT NULL DO UPDATE SET
+                    description = excluded.description,
+                    image_path = excluded.image_path,
+                    sex = excluded.sex
+                WHERE animals.description IS NOT excluded.description
+                   OR animals.image_path IS NOT excluded.image_path
+                   OR animals.sex IS NOT excluded.sex
+            """, [
+                (a["name"], a["description"], a["image_path"], a["species"], a["sex"], owner_id, seed_key(a))
+                for a in ANIMAIS_PARA_CADASTRAR
+            ])
+            
+            changed_keys = [
+                seed_key(a) for a in ANIMAIS_PARA_CADASTRAR
+                if existing.get(seed_key(a)) != (a["description"], a["image_path"], a["sex"])
+            ]
+            changed = []
+            if changed_keys:
+                cursor.execute(
+                    f"SELECT id FROM animals WHERE seed_key IN ({', '.join('?' * len(changed_keys))})",
+                    changed_keys,
+                )
+                changed = [row[0] for row in cursor.fetchall()]
+            
+            # Sem worker de jobs no seed: indexa aqui mesmo para /similar já responder
+            options = similar.settings()
+            for animal_id in changed:
+                similar.index_animal(conn, animal_id, options)
+            
+            cursor.execute("SELECT COUNT(*) FROM animals")
+            total = cursor.fetchone()[0]
         
-    except Exception as e:
-        print(f"Erro durante seed: {e}")
-        conn.rollback()
+        return total - before, total
     finally:
-        conn.close()
+        if own_connection:
+            conn.close()
 
 if __name__ == "__main__":
-    run_seed()
\ No newline at end of file
+    novos, total = run_seed()
+    print(f"Seed concluído: {novos} novos animais, {total} no total")
@@ -0,0 +1,313 @@
+"""Índice de "animais parecidos": espécie, sexo e TF-IDF da descrição.
+
+O índice fica no banco e é consultado por um simples top-k em similar_animals.
+`rebuild` recalcula tudo com NumPy; o job `index_similar` encaixa um animal novo
+sem reler a tabela inteira, usando o índice invertido animal_terms.
+"""
+import re
+import math
+import unicodedata
+from collections import Counter
+import numpy as np
+from database import current_settings
+from jobs import handler
+
+TOKEN = re.compile(r"[a-z]{3,}")
+
+STOPWORDS = frozenset("""
+    aos com como das dos ela ele elas eles essa esse esta este isso mas mais muito muita
+    nao nas nos para pela pelo por que sem sua seu suas seus tem uma umas uns bem ate
+    foi ser sao esta estao tambem quando onde quer
+""".split())
+
+# Pares (consulta, candidato) avaliados por bloco no rebuild; limita a memória usada
+PAIR_BUDGET = 4_000_000
+# Acima disso (animais x termos) o rebuild usa o índice invertido em vez da matriz densa
+DENSE_BUDGET = 16_000_000
+
+
+def tokenize(text):
+    """Termos da descrição sem acentos e sem palavras vazias, com suas contagens"""
+    if not text:
+        return Counter()
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode()
+    return Counter(term for term in TOKEN.findall(text) if term not in STOPWORDS)
+
+
+def idf(df, documents):
+    return math.log((1 + documents) / (1 + df)) + 1
+
+
+def term_weights(counts, dfs, documents):
+    """Pesos TF-IDF (tf sublinear) normalizados para norma 1"""
+    weights = {term: (1 + math.log(count)) * idf(dfs.get(term, 0), documents) for term, count in counts.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+    return {term: w / norm for term, w in weights.items()}
+
+
+def settings(config=None):
+    """Parâmetros do índice lidos da configuração (a da aplicação ativa, por padrão)"""
+    config = config or current_settings()
+    return {
+        "k": config["SIMILAR_TOP_K"],
+        "text": config["SIMILAR_WEIGHT_TEXT"],
+        "species": config["SIMILAR_WEIGHT_SPECIES"],
+        "sex": config["SIMILAR_WEIGHT_SEX"],
+        "max_df": config["SIMILAR_MAX_DF"],
+        "fanout": config["SIMILAR_FANOUT"],
+    }
+
+
+def _codes(values):
+    """Converte textos em inteiros para comparar com NumPy; None vira -1 e nunca coincide"""
+    mapping = {}
+    return np.array([-1 if v is None else mapping.setdefault(v, len(mapping)) for v in values], dtype=np.int32)
+
+
+def _top_k(scores, k):
+    """Índices dos k maiores valores positivos de cada linha, em ordem decrescente"""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    ordered = np.take_along_axis(part, np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1), axis=1)
+    return ordered
+
+
+class _Postings:
+    """Índice invertido em arrays (termo -> animais) para o produto esparso do rebuild"""
+
+    def __init__(self, indptr, indices, data, owner, active, terms):
+        self.indptr, self.indices, self.data, self.owner, self.active = indptr, indices, data, owner, active
+        order = np.argsort(indices[active], kind="stable")
+        self.docs = owner[active][order]
+        self.weights = data[active][order]
+        self.ptr = np.zeros(terms + 1, dtype=np.int64)
+        self.ptr[1:] = np.cumsum(np.bincount(indices[active], minlength=terms))
+
+    def scores(self, start, end, n):
+        """Produto escalar das linhas start:end com todos os animais"""
+        entries = np.arange(self.indptr[start], self.indptr[end])
+        entries = entries[self.active[entries]]
+        terms = self.indices[entries]
+        lengths = self.ptr[terms + 1] - self.ptr[terms]
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(self.ptr[terms] - offsets, lengths) + np.arange(int(lengths.sum()))
+        queries = np.repeat(self.owner[entries] - start, lengths)
+        return np.bincount(
+            queries * n + self.docs[positions],
+            weights=np.repeat(self.data[entries], lengths) * self.weights[positions],
+            minlength=(end - start) * n,
+        ).reshape(end - start, n)
+
+
+def rebuild(conn, options, in_transaction=False):
+    """Recalcula termos, pesos e as listas top-k de todos os animais numa transação.
+
+    O custo é quadrático no número de animais (cada um é comparado a todos), mas
+    feito em blocos de matriz; as consultas depois disso são só leituras do top-k.
+    Com `in_transaction` quem chama já abriu a transação (as migrações) e faz o commit.
+    Retorna o número de animais indexados.
+    """
+    rows = conn.execute("SELECT id, description, species, sex FROM animals ORDER BY id").fetchall()
+    n = len(rows)
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    species = _codes(row[2] for row in rows)
+    sexes = _codes(row[3] for row in rows)
+
+    vocabulary = {}
+    doc_terms = []
+    for row in rows:
+        counts = tokenize(row[1])
+        doc_terms.append({vocabulary.setdefault(term, len(vocabulary)): count for term, count in counts.items()})
+
+    # Matriz documento x termo esparsa (CSR) com os pesos TF-IDF normalizados
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(terms) for terms in doc_terms])
+    indices = np.fromiter((t for terms in doc_terms for t in terms), dtype=np.int64, count=indptr[-1])
+    tf = np.fromiter((c for terms in doc_terms for c in terms.values()), dtype=np.float64, count=indptr[-1])
+    df = np.bincount(indices, minlength=len(vocabulary))
+    data = (1 + np.log(tf)) * (np.log((1 + n) / (1 + df)) + 1)[indices]
+    owner = np.repeat(np.arange(n), np.diff(indptr))
+    norms = np.sqrt(np.bincount(owner, weights=data * data, minlength=n))
+    data /= np.where(norms > 0, norms, 1.0)[owner]
+
+    # Termos raros demais (um só animal) ou comuns demais não aproximam ninguém
+    active = (df[indices] >= 2) & (df[indices] <= max(2, options["max_df"] * n))
+    columns = np.unique(indices[active])
+    if n * len(columns) <= DENSE_BUDGET:
+        # Vocabulário pequeno: a matriz densa cabe e o produto fica com o BLAS
+        dense = np.zeros((n, len(columns)), dtype=np.float32)
+        dense[owner[active], np.searchsorted(columns, indices[active])] = data[active]
+
+        def text_scores(start, end):
+            return dense[start:end] @ dense.T
+    else:
+        postings = _Postings(indptr, indices, data, owner, active, len(vocabulary))
+
+        def text_scores(start, end):
+            return postings.scores(start, end, n)
+
+    k = min(options["k"], n - 1)
+    similar_rows = []
+    block = max(1, min(512, PAIR_BUDGET // max(n, 1)))
+    for start in range(0, n if k > 0 else 0, block):
+        end = min(n, start + block)
+        scores = options["text"] * text_scores(start, end).astype(np.float64)
+        scores += options["species"] * ((species[start:end, None] == species[None, :]) & (species[None, :] >= 0))
+        scores += options["sex"] * ((sexes[start:end, None] == sexes[None, :]) & (sexes[None, :] >= 0))
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = _top_k(scores, k)
+        best = np.take_along_axis(scores, top, axis=1)
+        keep = best > 0
+        similar_rows.extend(zip(
+            np.repeat(ids[start:end], k)[keep.ravel()].tolist(),
+            ids[top[keep]].tolist(),
+            best[keep].tolist(),
+        ))
+
+    terms_by_index = list(vocabulary)
+    if not in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM similar_animals")
+        conn.execute("DELETE FROM animal_terms")
+        conn.execute("DELETE FROM similar_terms")
+        conn.executemany(
+            "INSERT INTO similar_terms (term, df) VALUES (?, ?)",
+            ((term, int(df[i])) for i, term in enumerate(terms_by_index)),
+        )
+        conn.executemany(
+            "INSERT INTO animal_terms (term, animal_id, weight) VALUES (?, ?, ?)",
+            ((terms_by_index[t], int(ids[d]), float(w)) for d, t, w in zip(owner, indices, data)),
+        )
+        conn.executemany("INSERT INTO similar_animals (animal_id, similar_id, score) VALUES (?, ?, ?)", similar_rows)
+        bump_generation(conn)
+        if not in_transaction:
+            conn.commit()
+    except BaseException:
+        if not in_transaction:
+            conn.rollback()
+        raise
+    return n
+
+
+def index_animal(conn, animal_id, options):
+    """Indexa um animal e o encaixa nas listas dos mais parecidos com ele.
+
+    Lê só os animais que compartilham algum termo (pelo índice invertido) e os mais
+    recentes da mesma espécie; o commit fica com quem chama.
+    """
+    animal = conn.execute("SELECT id, description, species, sex FROM animals WHERE id = ?", (animal_id,)).fetchone()
+    if animal is None:
+        return
+
+    # Reindexar é idempotente: retira a versão anterior antes
+    conn.execute("""
+        UPDATE similar_terms SET df = df - 1
+        WHERE term IN (SELECT term FROM animal_terms WHERE animal_id = ?)
+    """, (animal_id,))
+    conn.execute("DELETE FROM animal_terms WHERE animal_id = ?", (animal_id,))
+
+    documents = conn.execute("SELECT COUNT(*) FROM animals").fetchone()[0]
+    counts = tokenize(animal["description"])
+    terms = list(counts)
+    dfs = {}
+    for i in range(0, len(terms), 500):
+        chunk = terms[i:i + 500]
+        dfs.update(conn.execute(
+            f"SELECT term, df FROM similar_terms WHERE term IN ({', '.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    weights = term_weights(counts, dfs, documents)
+
+    # Candidatos por texto: postings dos termos nem raros nem comuns demais
+    shared = [t for t in terms if 1 <= dfs.get(t, 0) <= max(2, options["max_df"] * documents)]
+    posting_ids, posting_products = [], []
+    for term in shared:
+        for other_id, weight in conn.execute("SELECT animal_id, weight FROM animal_terms WHERE term = ?", (term,)):
+            posting_ids.append(other_id)
+            posting_products.append(weights[term] * weight)
+
+    candidate_ids = np.array(posting_ids, dtype=np.int64)
+    text = np.zeros(0)
+    if len(candidate_ids):
+        candidate_ids, inverse = np.unique(candidate_ids, return_inverse=True)
+        text = np.bincount(inverse, weights=np.array(posting_products), minlength=len(candidate_ids))
+
+    # Sem texto em comum, a mesma espécie ainda conta
+    if animal["species"] is not None:
+        recent = [row[0] for row in conn.execute(
+            "SELECT id FROM animals WHERE species = ? AND id != ? ORDER BY id DESC LIMIT ?",
+            (animal["species"], animal_id, options["fanout"]),
+        )]
+        extra = np.setdiff1d(np.array(recent, dtype=np.int64), candidate_ids)
+        candidate_ids = np.concatenate([candidate_ids, extra])
+        text = np.concatenate([text, np.zeros(len(extra))])
+
+    conn.execute("DELETE FROM similar_animals WHERE animal_id = ?", (animal_id,))
+    conn.executemany(
+        "INSERT INTO similar_terms (term, df) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET df = df + 1",
+        ((term,) for term in terms),
+    )
+    conn.executemany(
+        "INSERT INTO animal_terms (term, animal_id, weight) VALUES (?, ?, ?)",
+        ((term, animal_id, weight) for term, weight in weights.items()),
+    )
+
+    mask = candidate_ids != animal_id
+    candidate_ids, text = candidate_ids[mask], text[mask]
+    if not len(candidate_ids):
+        return
+
+    attributes = {}
+    id_list = [int(i) for i in candidate_ids]
+    for i in range(0, len(id_list), 500):
+        chunk = id_list[i:i + 500]
+        for row in conn.execute(
+            f"SELECT id, species, sex FROM animals WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+        ):
+            attributes[row["id"]] = (row["species"], row["sex"])
+    same_species = np.array([
+        animal["species"] is not None and attributes.get(i, (None, None))[0] == animal["species"] for i in id_list
+    ])
+    same_sex = np.array([
+        animal["sex"] is not None and attributes.get(i, (None, None))[1] == animal["sex"] for i in id_list
+    ])
+    scores = options["text"] * text + options["species"] * same_species + options["sex"] * same_sex
+    exists = np.array([i in attributes for i in id_list])
+    scores = np.where(exists, scores, 0.0)
+
+    order = np.argsort(-scores)
+    top = [(int(candidate_ids[i]), float(scores[i])) for i in order[:options["k"]] if scores[i] > 0]
+    conn.executemany(
+        "INSERT INTO similar_animals (animal_id, similar_id, score) VALUES (?, ?, ?)",
+        ((animal_id, other_id, score) for other_id, score in top),
+    )
+
+    # A similaridade é simétrica: o novo animal pode entrar na lista dos mais próximos
+    neighbours = [(int(candidate_ids[i]), float(scores[i])) for i in order[:options["fanout"]] if scores[i] > 0]
+    conn.executemany("""
+        INSERT INTO similar_animals (animal_id, similar_id, score) VALUES (?, ?, ?)
+        ON CONFLICT (animal_id, similar_id) DO UPDATE SET score = excluded.score
+    """, ((other_id, animal_id, score) for other_id, score in neighbours))
+    conn.executemany("""
+        DELETE FROM similar_animals
+        WHERE animal_id = ? AND similar_id NOT IN (
+            SELECT similar_id FROM similar_animals WHERE animal_id = ? ORDER BY score DESC LIMIT ?
+        )
+    """, ((other_id, other_id, options["k"]) for other_id, _ in neighbours))
+    bump_generation(conn)
+
+
+def bump_generation(conn):
+    # Gravar só nas tabelas do índice não dispara os triggers de animals
+    conn.execute("""
+        UPDATE cache_generations
+        SET value = value + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+        WHERE name = 'animals'
+    """)
+
+
+@handler("index_similar")
+def index_similar(conn, payload):
+    """Job: encaixa um animal novo no índice de parecidos"""
+    index_animal(conn, payload["animal_id"], settings())
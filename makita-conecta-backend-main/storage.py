@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import time
+import shutil
+import tempfile
+from contextlib import contextmanager
+from flask import current_app
+from werkzeug.security import safe_join
+
+# ab/cd/<sha256>.jpg e as variantes ab/cd/<sha256>_thumb.webp
+CONTENT_KEY = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})(?:_[a-z]+)?\.[a-z0-9]+$")
+
+
+def blob_key(digest, ext):
+    """Chave de um conteúdo: dois níveis de diretório pelo início do hash, para nenhum ficar enorme"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def variant_key(key, name, ext):
+    """Chave de uma variante, ao lado do original e derivada dele"""
+    return f"{os.path.splitext(key)[0]}_{name}.{ext}"
+
+
+class LocalStorage:
+    """Blobs como arquivos sob `root`; é o UPLOAD_FOLDER por padrão"""
+
+    def __init__(self, root):
+        self.root = root
+        # Temporários no mesmo sistema de arquivos: publicar é só um rename atômico
+        self.temp_dir = os.path.join(root, ".tmp")
+        os.makedirs(self.temp_dir, exist_ok=True)
+
+    def path(self, key):
+        """Caminho do arquivo de `key`, ou None se a chave sair da raiz"""
+        return safe_join(self.root, key)
+
+    def exists(self, key):
+        path = self.path(key)
+        return path is not None and os.path.isfile(path)
+
+    def put_file(self, key, source_path):
+        """Move `source_path` para `key`; o arquivo de origem deixa de existir"""
+        target = self.path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(source_path, target)
+
+    @contextmanager
+    def local_path(self, key):
+        yield self.path(key)
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        """Local não tem URL própria: a API serve o arquivo"""
+        return None
+
+
+class S3Storage:
+    """Blobs num bucket S3 ou compatível (MinIO, por exemplo, como substituto local)"""
+
+    temp_dir = None
+
+    def __init__(self, bucket, prefix, client, url_expires):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+        self.url_expires = url_expires
+
+    def _name(self, key):
+        return self.prefix + key
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._name(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def put_file(self, key, source_path):
+        self.client.upload_file(source_path, self.bucket, self._name(key))
+        os.unlink(source_path)
+
+    @contextmanager
+    def local_path(self, key):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._name(key), path)
+            yield path
+        finally:
+            os.unlink(path)
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._name(key))
+
+    def url(self, key):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._name(key)}, ExpiresIn=self.url_expires
+        )
+
+
+def create_storage(config):
+    """STORAGE_URL vazia ou file:///caminho grava em disco; s3://bucket/prefixo usa o boto3"""
+    url = config["STORAGE_URL"]
+    if not url:
+        return LocalStorage(config["UPLOAD_FOLDER"])
+    if url.startswith("file://"):
+        return LocalStorage(url[len("file://"):])
+    if url.startswith("s3://"):
+        import boto3
+
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        client = boto3.client(
+            "s3",
+            endpoint_url=config["STORAGE_S3_ENDPOINT"] or None,
+            region_name=config["STORAGE_S3_REGION"] or None,
+        )
+        return S3Storage(bucket, prefix.rstrip("/") + "/" if prefix else "", client, config["STORAGE_URL_EXPIRES"])
+    raise ValueError(f"STORAGE_URL não suportada: {url}")
+
+
+def claim_blob(conn, key, size):
+    """Registra (ou reaviva) o blob antes de gravar o arquivo, numa transação própria.
+
+    Um blob sem referências com orphaned_at recente não é coletado, então o arquivo
+    continua lá até o INSERT do animal subir o refcount.
+    """
+    with conn:
+        conn.execute("""
+            INSERT INTO blobs (key, size, orphaned_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                orphaned_at = CASE WHEN refcount = 0 THEN excluded.orphaned_at END
+        """, (key, size, time.time()))
+
+
+def collect_garbage(conn, storage, grace, batch_size):
+    """Remove um lote de blobs sem referência há mais de `grace` segundos.
+
+    Lê só o índice parcial dos órfãos, nunca a tabela inteira. Os arquivos são apagados
+    com o lock de escrita do banco, para um upload não reaproveitar o blob no meio.
+    Retorna quantos blobs foram removidos.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute("""
+            DELETE FROM blobs WHERE key IN (
+                SELECT key FROM blobs
+                WHERE refcount = 0 AND orphaned_at < ?
+                ORDER BY orphaned_at
+                LIMIT ?
+            )
+            RETURNING key, variants
+        """, (time.time() - grace, batch_size)).fetchall()
+        for key, variants in rows:
+            for name in [key] + list(_variant_keys(variants)):
+                storage.delete(name)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(rows)
+
+
+def _variant_keys(variants):
+    return json.loads(variants).values() if variants else ()
+
+
+def init_app(app):
+    app.extensions["storage"] = create_storage(app.config)
+
+
+def get_storage():
+    return current_app.extensions["storage"]
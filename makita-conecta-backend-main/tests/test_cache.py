@@ -0,0 +1,50 @@
+import pytest
+import cache
+from config import Config
+from app import create_app
+from database import connect, init_db
+from seed_animal import run_seed
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        DB_NAME = str(tmp_path / "database.db")
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        RATELIMIT_ENABLED = False
+        CACHE_GENERATION_INTERVAL = 60
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        init_db()
+        run_seed()
+    return app
+
+
+def test_hit_reuses_the_generation(app, monkeypatch):
+    client = app.test_client()
+    assert client.get("/api/animals/facets").headers["X-Cache"] == "MISS"
+
+    reads = []
+    read_generation = cache._read_generation
+    monkeypatch.setattr(cache, "_read_generation", lambda name: reads.append(name) or read_generation(name))
+
+    assert client.get("/api/animals/facets").headers["X-Cache"] == "HIT"
+    assert reads == []
+
+
+def test_write_request_forgets_generations(app):
+    client = app.test_client()
+    client.get("/api/animals/facets")
+    with app.app_context():
+        conn = connect()
+        with conn:
+            conn.execute("UPDATE animals SET sex = 'macho' WHERE name = 'Luna'")
+        conn.close()
+
+    # Outro processo gravou: o memo ainda vale
+    assert client.get("/api/animals/facets").headers["X-Cache"] == "HIT"
+
+    client.post("/api/login", json={"email": "ninguem@example.com", "password": "x"})
+
+    assert client.get("/api/animals/facets").headers["X-Cache"] == "MISS"
@@ -0,0 +1,41 @@
+import pytest
+from config import Config
+from app import create_app
+from database import init_db
+
+
+@pytest.fixture
+def apps(tmp_path):
+    """Duas aplicações no mesmo banco, como dois workers do gunicorn"""
+    class TestConfig(Config):
+        DB_NAME = str(tmp_path / "database.db")
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        RATELIMIT_ENABLED = False
+        CACHE_ENABLED = False
+        BCRYPT_LOG_ROUNDS = 4
+        PASSWORD_WORKERS = 0
+
+    first, second = create_app(TestConfig), create_app(TestConfig)
+    with first.app_context():
+        init_db()
+    return first, second
+
+
+def login(client):
+    user = {"name": "Ana", "email": "ana@example.com", "password": "segredo"}
+    client.post("/api/register", json=user)
+    token = client.post("/api/login", json=user).get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_deleted_user_cannot_write_through_stale_identity(apps):
+    first, second = (app.test_client() for app in apps)
+    headers = login(first)
+
+    # O segundo worker guarda a identidade em cache
+    assert second.get("/api/profile", headers=headers).status_code == 200
+    assert first.delete("/api/profile", headers=headers).status_code == 200
+
+    response = second.put("/api/profile", json={"name": "Outra"}, headers=headers)
+
+    assert response.status_code == 401
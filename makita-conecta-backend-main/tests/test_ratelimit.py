@@ -0,0 +1,45 @@
+import pytest
+from config import Config
+from app import create_app
+from database import init_db
+import identity
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        DB_NAME = str(tmp_path / "database.db")
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        CACHE_ENABLED = False
+        RATELIMIT_CAPACITY = 10
+        RATELIMIT_REFILL_RATE = 0.001
+        RATELIMIT_COSTS = {"auth.login_user": 60}
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        init_db()
+    return app
+
+
+def test_cost_above_capacity_is_capped(app):
+    client = app.test_client()
+    credentials = {"email": "ninguem@example.com", "password": "errada"}
+
+    first = client.post("/api/login", json=credentials)
+    second = client.post("/api/login", json=credentials)
+
+    assert first.status_code != 429
+    assert second.status_code == 429
+
+
+def test_user_bucket_does_not_load_the_user(app, monkeypatch):
+    with app.app_context():
+        token = identity.token_for({"id": 1, "email": "ana@example.com"})
+    monkeypatch.setattr(identity, "load_user", lambda user_id: pytest.fail("usuario consultado antes do limite"))
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/api/login", json={"email": "ana@example.com", "password": "errada"}, headers=headers)
+
+    response = client.post("/api/login", json={"email": "ana@example.com", "password": "errada"}, headers=headers)
+
+    assert response.status_code == 429
@@ -0,0 +1,60 @@
+import pytest
+from config import Config
+from app import create_app
+from database import connect, init_db
+from seed_animal import run_seed
+import migrations
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        DB_NAME = str(tmp_path / "database.db")
+        UPLOAD_FOLDER = str(tmp_path / "uploads")
+        RATELIMIT_ENABLED = False
+        CACHE_ENABLED = False
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        init_db()
+    return app
+
+
+def animal_id(app, name):
+    with app.app_context():
+        conn = connect()
+        try:
+            return conn.execute("SELECT id FROM animals WHERE name = ?", (name,)).fetchone()[0]
+        finally:
+            conn.close()
+
+
+def test_seeded_animals_have_similar(app):
+    with app.app_context():
+        run_seed()
+
+    response = app.test_client().get(f"/api/animals/{animal_id(app, 'Luna')}/similar")
+
+    assert response.status_code == 200
+    animals = response.get_json()["animals"]
+    assert animals
+    # Os outros gatos vêm antes dos cachorros
+    assert animals[0]["species"] == "gato"
+
+
+def test_upgrade_indexes_existing_animals(app):
+    with app.app_context():
+        run_seed()
+        conn = connect()
+        try:
+            conn.execute("DELETE FROM similar_animals")
+            conn.execute("DELETE FROM animal_terms")
+            conn.execute("DELETE FROM similar_terms")
+            conn.execute(f"PRAGMA user_version = {migrations.latest_version() - 1}")
+            conn.commit()
+            migrations.upgrade(conn)
+            indexed = conn.execute("SELECT COUNT(DISTINCT animal_id) FROM similar_animals").fetchone()[0]
+        finally:
+            conn.close()
+
+    assert indexed == 8
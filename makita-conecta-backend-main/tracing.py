@@ -0,0 +1,153 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from flask import g, request
+
+LOGGER_NAME = "makita"
+
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formata registros como texto com pares chave=valor ou como JSON"""
+
+    def __init__(self, as_json=False):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _RESERVED_ATTRS}
+        if self.as_json:
+            payload = {
+                "ts": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                payload["exc"] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str, ensure_ascii=False)
+
+        line = super().format(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v!r}" for k, v in fields.items())
+        return line
+
+
+def get_logger(name=None):
+    """Retorna um logger filho do logger da aplicação"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}" if name else LOGGER_NAME)
+
+
+class RequestTrace:
+    """Acumula tempos por etapa e contagem de linhas de uma requisição"""
+
+    __slots__ = ("start", "spans", "rows")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.rows = None
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.spans.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+@contextmanager
+def span(name):
+    """Mede um trecho da requisição quando o tracing estiver ativo"""
+    trace = g.get("trace")
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+def timed(name, chunks):
+    """Mede só o tempo gasto gerando os pedaços de uma resposta em streaming,
+    sem contar a espera pelo cliente entre um pedaço e outro"""
+    trace = g.get("trace")
+    if trace is None:
+        yield from chunks
+        return
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            trace.add(name, time.perf_counter() - start)
+        yield chunk
+
+
+def set_rows(count):
+    """Registra quantas linhas a requisição retornou"""
+    trace = g.get("trace")
+    if trace is not None:
+        trace.rows = count
+
+
+def _start_trace():
+    g.trace = RequestTrace()
+
+
+def _finish_trace(response):
+    trace = g.get("trace")
+    if trace is None:
+        return response
+
+    # Em streaming o corpo ainda não foi gerado: o cabeçalho leva o que já foi medido
+    # e o registro no log fica para quando a resposta terminar de ser enviada
+    response.headers["Server-Timing"] = trace.server_timing()
+    if trace.rows is not None:
+        response.headers["X-Row-Count"] = str(trace.rows)
+
+    endpoint, status = request.endpoint, response.status_code
+    if response.is_streamed:
+        response.call_on_close(lambda: _log_trace(trace, endpoint, status))
+    else:
+        _log_trace(trace, endpoint, status)
+    return response
+
+
+def _log_trace(trace, endpoint, status):
+    logger = get_logger("trace")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "requisicao",
+            extra={
+                "endpoint": endpoint,
+                "status": status,
+                "rows": trace.rows,
+                **{f"{name}_ms": round(seconds * 1000, 2) for name, seconds in trace.spans.items()},
+                "total_ms": round((time.perf_counter() - trace.start) * 1000, 2),
+            },
+        )
+
+
+def init_app(app):
+    """Configura o logging da aplicação e, se habilitado, o tracing por requisição"""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(app.config.get("LOG_LEVEL", "INFO"))
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(StructuredFormatter(as_json=app.config.get("LOG_FORMAT") == "json"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+    if app.config.get("REQUEST_TIMING"):
+        app.before_request(_start_trace)
+        app.after_request(_finish_trace)
@@ -0,0 +1,59 @@
+"""Ponto de entrada de produção.
+
+    gunicorn -c gunicorn.conf.py wsgi:app    (Linux/macOS: vários processos com threads)
+    python wsgi.py                           (waitress: um processo com threads; funciona no Windows)
+
+Importar este módulo cria a aplicação sem abrir conexões nem processos: o pool do
+banco, o pool do bcrypt e o limitador são criados sob demanda em cada processo, então
+o gunicorn pode carregá-la uma vez no master (preload) e fazer fork dos workers.
+"""
+import atexit
+import mailer
+from app import create_app
+from tracing import get_logger
+
+logger = get_logger(__name__)
+
+app = create_app()
+
+
+def drain():
+    """Sai do balanceador e encerra os streams SSE, que de outro modo nunca terminariam.
+
+    As requisições comuns em andamento seguem até o fim.
+    """
+    app.extensions["health"].draining = True
+    app.extensions["changes"].stop()
+
+
+def shutdown(timeout=None):
+    """Encerramento gracioso deste processo: sai do balanceador e libera os recursos.
+
+    Chamado depois que as requisições em andamento terminaram (worker_exit do gunicorn
+    ou saída do waitress).
+    """
+    drain()
+    mailer.stop_sender(timeout)
+    app.extensions["passwords"].shutdown()
+    app.extensions["db_pool"].close_all()
+    if "metrics_store" in app.extensions:
+        app.extensions["metrics_store"].stop()
+    logger.info("processo encerrado")
+
+
+def serve():
+    """Serve com waitress usando WEB_BIND e WEB_THREADS"""
+    from waitress import serve as waitress_serve
+
+    config = app.config
+    atexit.register(shutdown, config["WEB_GRACEFUL_TIMEOUT"])
+    waitress_serve(
+        app,
+        listen=config["WEB_BIND"],
+        threads=config["WEB_THREADS"],
+        channel_timeout=config["WEB_TIMEOUT"],
+    )
+
+
+if __name__ == "__main__":
+    serve()
@@ -18,15 +18,15 @@ export function AnimalCarousel() {
   const containerRef = useRef<HTMLDivElement>(null)
 
   useEffect(() => {
-    fetch("http://127.0.0.1:5000/api/animals")
+    fetch("http://127.0.0.1:5000/api/animals?limit=12&fields=id,name,description,image_url,image_urls")
       .then((res) => res.json())
       .then((data) => {
-        if (Array.isArray(data)) {
-          const backendAnimals: Animal[] = data.map((item: any) => ({
+        if (Array.isArray(data.animals)) {
+          const backendAnimals: Animal[] = data.animals.map((item: any) => ({
             id: item.id,
             name: item.name,
             description: item.description,
-            image: item.image_url || "https://placehold.co/600x400?text=Sem+Foto", 
+            image: item.image_urls?.card || item.image_url || "https://placehold.co/600x400?text=Sem+Foto", 
             breed: "Recém chegado", 
             age: "Disponível"       
           }));
@@ -18,7 +18,12 @@ type SessionContextProps = {
     changePasswordOfUser: (newPassword: string) => Promise<void>
     deleteMyAccount: () => Promise<void>
     updateAccount: (name: string) => Promise<void>
-    fetchAnimalsByQuery: (query: string, sex?: string, species?: string) => Promise<any[]>
+    fetchAnimalsByQuery: (query: string, sex?: string, species?: string, after?: string) => Promise<AnimalsPage>
+}
+
+export type AnimalsPage = {
+    animals: any[]
+    nextCursor: string | null
 }
 
 export const SessionContext = createContext<SessionContextProps>({
@@ -30,7 +35,7 @@ export const SessionContext = createContext<SessionContextProps>({
     changePasswordOfUser: async () => { },
     deleteMyAccount: async () => { },
     updateAccount: async () => { },
-    fetchAnimalsByQuery: async () => []
+    fetchAnimalsByQuery: async () => ({ animals: [], nextCursor: null })
 })
 
 type SessionProviderProps = {
@@ -227,8 +232,9 @@ export function SessionProvider({ children }: SessionProviderProps) {
         }
     }
 
-    async function fetchAnimalsByQuery(query: string, sex?: string, species?: string) {
-        setSearchParams(prev => {
+    // A API devolve uma página por vez; `after` é o next_cursor da página anterior
+    async function fetchAnimalsByQuery(query: string, sex?: string, species?: string, after?: string): Promise<AnimalsPage> {
+        if (!after) setSearchParams(prev => {
             const newParams = new URLSearchParams(prev);
 
             if (query && query.trim().length > 0) newParams.set("q", query);
@@ -248,16 +254,18 @@ export function SessionProvider({ children }: SessionProviderProps) {
         if (query && query.trim().length > 0) apiParams.append("query", query);
         if (sex && sex !== "todos") apiParams.append("sex", sex);
         if (species && species !== "todos") apiParams.append("species", species);
+        if (after) apiParams.append("after", after);
 
         try {
             const response = await fetch(`${API_URL}/api/animals?${apiParams.toString()}`);
             if (response.ok) {
-                return await response.json();
+                const data = await response.json();
+                return { animals: data.animals ?? [], nextCursor: data.next_cursor ?? null };
             }
-            return [];
+            return { animals: [], nextCursor: null };
         } catch (error) {
             console.error("Erro na busca:", error);
-            return [];
+            return { animals: [], nextCursor: null };
         }
     }
 
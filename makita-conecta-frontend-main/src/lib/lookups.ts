@@ -0,0 +1,19 @@
+// Rótulos dos códigos de espécie e sexo devolvidos pela API (lookups.py no backend)
+export const SPECIES_LABELS: Record<string, string> = {
+  cachorro: "Cachorro",
+  gato: "Gato",
+  outro: "Outro",
+}
+
+export const SEX_LABELS: Record<string, string> = {
+  macho: "Macho",
+  femea: "Fêmea",
+}
+
+export function speciesLabel(code?: string | null) {
+  return code ? SPECIES_LABELS[code] ?? code : "Não informado"
+}
+
+export function sexLabel(code?: string | null) {
+  return code ? SEX_LABELS[code] ?? code : "Não informado"
+}
@@ -11,6 +11,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { useContext, useEffect, useState } from "react"
 import { SessionContext } from "@/contexts/session"
 import { useNavigate } from "react-router"
+import { sexLabel, speciesLabel } from "@/lib/lookups"
 
 type Animal = {
   id: number;
@@ -19,6 +20,7 @@ type Animal = {
   species: string;
   sex: string;
   image_url: string;
+  image_urls?: { thumb?: string; card?: string; full?: string } | null;
 };
 
 export default function Home() {
@@ -26,7 +28,9 @@ export default function Home() {
   const [animalType, setAnimalType] = useState('todos');
   const [sex, setSex] = useState('todos');
   const [animals, setAnimals] = useState<Animal[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [params, setSearchParams] = useSearchParams();
   const navigate = useNavigate();
 
@@ -52,20 +56,42 @@ export default function Home() {
     setLoading(true);
     try {
       const searchQuery = query || '';
-      const data = await fetchAnimalsByQuery(
+      const page = await fetchAnimalsByQuery(
         searchQuery, 
         sexParam !== 'todos' ? sexParam : undefined,
         speciesParam !== 'todos' ? speciesParam : undefined
       );
-      setAnimals(data);
+      setAnimals(page.animals);
+      setNextCursor(page.nextCursor);
     } catch (error) {
       console.error("Erro na busca:", error);
       setAnimals([]);
+      setNextCursor(null);
     } finally {
       setLoading(false);
     }
   };
 
+  // A busca é paginada: cada clique traz a página seguinte pelo next_cursor
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchAnimalsByQuery(
+        query,
+        sexParam !== 'todos' ? sexParam : undefined,
+        speciesParam !== 'todos' ? speciesParam : undefined,
+        nextCursor
+      );
+      setAnimals(prev => [...prev, ...page.animals]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Erro na busca:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleApplyFilters = () => {
     const newParams = new URLSearchParams();
     
@@ -83,6 +109,7 @@ export default function Home() {
     setSex('todos');
     setSearchParams(new URLSearchParams());
     setAnimals([]);
+    setNextCursor(null);
     setIsSearchMode(false); // Volta para tela inicial
   };
 
@@ -139,7 +166,7 @@ export default function Home() {
                   <SelectContent>
                     <SelectItem value="todos">Todos</SelectItem>
                     <SelectItem value="macho">Macho</SelectItem>
-                    <SelectItem value="fêmea">Fêmea</SelectItem>
+                    <SelectItem value="femea">Fêmea</SelectItem>
                   </SelectContent>
                 </Select>
               </div>
@@ -157,7 +184,7 @@ export default function Home() {
               
               <div className="flex items-end">
                 <p className="text-sm text-gray-500">
-                  {animals.length} animal{animals.length !== 1 ? 'is' : ''} encontrado{animals.length !== 1 ? 's' : ''}
+                  {animals.length}{nextCursor ? '+' : ''} animal{animals.length !== 1 ? 'is' : ''} encontrado{animals.length !== 1 ? 's' : ''}
                 </p>
               </div>
             </CardContent>
@@ -178,7 +205,7 @@ export default function Home() {
                   >
                     <div className="aspect-video overflow-hidden">
                       <img
-                        src={animal.image_url || "/placeholder-animal.jpg"}
+                        src={animal.image_urls?.card || animal.image_url || "/placeholder-animal.jpg"}
                         alt={animal.name}
                         className="w-full h-full object-cover hover:scale-105 transition-transform duration-300"
                       />
@@ -187,13 +214,13 @@ export default function Home() {
                       <div className="flex justify-between items-start mb-2">
                         <h3 className="font-bold text-lg">{animal.name}</h3>
                         <span className="text-sm px-2 py-1 rounded-full bg-gray-100">
-                          {animal.species}
+                          {speciesLabel(animal.species)}
                         </span>
                       </div>
                       <p className="text-sm text-gray-600 mb-3 line-clamp-2">{animal.description}</p>
                       <div className="flex justify-between items-center">
                         <span className="text-sm text-gray-500">
-                          {animal.sex === 'macho' ? '♂ Macho' : '♀ Fêmea'}
+                          {animal.sex === 'macho' ? '♂ ' : animal.sex === 'femea' ? '♀ ' : ''}{sexLabel(animal.sex)}
                         </span>
                         <Button 
                           size="sm" 
@@ -208,6 +235,13 @@ export default function Home() {
                     </CardContent>
                   </Card>
                 ))}
+                {nextCursor && (
+                  <div className="col-span-full flex justify-center">
+                    <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                      {loadingMore ? "Carregando..." : "Carregar mais"}
+                    </Button>
+                  </div>
+                )}
               </div>
             ) : (
               <div className="text-center py-12">